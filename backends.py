@@ -0,0 +1,54 @@
+"""
+Model providers. Each backend is a factory that takes a model name and
+returns a client with a genai-style generate_content(prompt,
+generation_config=...) method. Clients are created once per (backend,
+model name) and shared by every caller in the process.
+"""
+
+from dotenv import load_dotenv
+import os
+import threading
+
+load_dotenv()
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+
+backends = {}
+clients = {}
+clients_lock = threading.Lock()
+
+
+def register_backend(name, factory):
+    backends[name] = factory
+
+
+def gemini_backend(model_name):
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai.GenerativeModel(model_name)
+
+
+def stub_backend(model_name):
+    from fake_model import FakeGenerativeModel
+
+    latency = float(os.getenv("STUB_LATENCY", "0.5"))
+    failure_rate = float(os.getenv("STUB_FAILURE_RATE", "0"))
+    return FakeGenerativeModel(model_name, latency=latency, failure_rate=failure_rate)
+
+
+register_backend("gemini", gemini_backend)
+register_backend("stub", stub_backend)
+
+
+def get_client(model_name, backend=None):
+    backend = backend or LLM_BACKEND
+    if backend not in backends:
+        raise ValueError(
+            f"Unknown LLM backend '{backend}', expected one of: {', '.join(sorted(backends))}"
+        )
+    with clients_lock:
+        key = (backend, model_name)
+        if key not in clients:
+            clients[key] = backends[backend](model_name)
+        return clients[key]
@@ -0,0 +1,334 @@
+"""
+Offline benchmarks for startup, extraction, chunking and end-to-end
+generation.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --quick --latency 0.05 --failure-rate 0.05
+
+Fixtures are generated in memory and every model call goes to
+fake_model.FakeGenerativeModel, so no API key or network is needed. Results
+are printed as JSON so two runs can be diffed or compared by script.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+from extraction import extract_doc, extract_pdf, extract_text, extractors
+from fake_model import FakeGenerativeModel
+from preprocess import preprocess
+import scheduler
+import summarizer
+
+WORDS = (
+    "memory cache thread process kernel network packet latency throughput "
+    "consistency replica storage index query planner compiler register "
+    "pipeline branch vector scheduler quota budget model token chunk summary"
+).split()
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+# Modules the home page should not need; each loads with its first use
+LAZY_MODULES = ("PyPDF2", "mammoth", "numpy", "google.generativeai")
+# Run in a fresh interpreter, so nothing is imported beforehand. The script
+# is compiled once, as a Streamlit server does, so the rerun is the app's own cost.
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+
+compiled = {}
+get_bytecode = ScriptCache.get_bytecode
+ScriptCache.get_bytecode = lambda self, path: compiled.get(path) or compiled.setdefault(
+    path, get_bytecode(self, path)
+)
+at = AppTest.from_file(sys.argv[1], default_timeout=60).run()
+rendered = time.perf_counter()
+at.run()
+print(json.dumps({
+    "streamlit_import_seconds": imported - started,
+    "first_render_seconds": rendered - imported,
+    "rerun_seconds": time.perf_counter() - rendered,
+    "loaded": [m for m in sys.argv[2:] if m in sys.modules],
+}))
+"""
+
+
+# -------------------- FIXTURES --------------------
+def make_text(words, seed=0):
+    """
+    Deterministic prose of roughly the given number of words, in sentences
+    of 8-20 words and paragraphs of 5-10 sentences.
+    """
+    rng = random.Random(seed)
+    paragraphs = []
+    written = 0
+    while written < words:
+        sentences = []
+        for _ in range(rng.randint(5, 10)):
+            length = rng.randint(8, 20)
+            sentence = " ".join(rng.choice(WORDS) for _ in range(length))
+            sentences.append(sentence.capitalize() + ".")
+            written += length
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+
+def make_pdf(pages, lines_per_page=40, seed=0, furniture=False):
+    """
+    A minimal uncompressed PDF with one Helvetica text stream per page.
+    With furniture, pages look like a typical report: a running header, a
+    "Page n of m" footer and a word hyphenated across every fourth line.
+    """
+    rng = random.Random(seed)
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+
+    def add(obj):
+        offsets.append(len(out))
+        out.extend(f"{len(offsets)} 0 obj\n".encode() + obj + b"\nendobj\n")
+
+    page_ids = [4 + 2 * i for i in range(pages)]
+    add(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    add(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for number, page_id in enumerate(page_ids, 1):
+        lines = [[rng.choice(WORDS) for _ in range(10)] for _ in range(lines_per_page)]
+        if furniture:
+            for i in range(3, lines_per_page - 1, 4):
+                word = lines[i].pop()
+                lines[i].append(word[: len(word) // 2] + "-")
+                lines[i + 1].insert(0, word[len(word) // 2 :])
+            lines.insert(0, "Acme Systems - Quarterly Engineering Report".split())
+            lines.append(f"Page {number} of {pages}".split())
+        lines = " ".join(
+            "(" + " ".join(line) + ("" if line[-1].endswith("-") else ".") + ") '"
+            for line in lines
+        )
+        content = f"BT /F1 10 Tf 50 780 Td 12 TL {lines} ET".encode()
+        add(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> "
+            + f"/Contents {page_id + 1} 0 R >>".encode()
+        )
+        add(f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+
+    xref = len(out)
+    out.extend(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.extend(f"{offset:010d} 00000 n \n".encode())
+    out.extend(
+        f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n".encode()
+    )
+    return bytes(out)
+
+
+def make_docx(text):
+    """
+    A minimal DOCX with one paragraph per paragraph of text.
+    """
+    body = "".join(
+        f"<w:p><w:r><w:t>{paragraph}</w:t></w:r></w:p>"
+        for paragraph in text.split("\n\n")
+    )
+    ns = "http://schemas.openxmlformats.org"
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<w:document xmlns:w="{ns}/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<Types xmlns="{ns}/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        "</Types>"
+    )
+    rels = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<Relationships xmlns="{ns}/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{ns}/officeDocument/2006/relationships/officeDocument" '
+        'Target="word/document.xml"/></Relationships>'
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as docx:
+        docx.writestr("[Content_Types].xml", content_types)
+        docx.writestr("_rels/.rels", rels)
+        docx.writestr("word/document.xml", document)
+    return buffer.getvalue()
+
+
+# -------------------- BENCHMARKS --------------------
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_startup(repeat):
+    """
+    Cold start of the app: importing streamlit, the first render of the home
+    page (which imports the app's modules) and a rerun, best of repeat fresh
+    interpreters, and which of LAZY_MODULES the home page loaded anyway.
+    """
+    runs = []
+    with tempfile.TemporaryDirectory() as store:
+        env = dict(
+            os.environ,
+            LLM_BACKEND="stub",
+            LLM_CACHE_PATH="",
+            EXTRACTION_CACHE_PATH="",
+            DOC_STORE_DIR=store,
+        )
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", STARTUP_SCRIPT, APP_PATH, *LAZY_MODULES],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+    result = {
+        key: min(run[key] for run in runs)
+        for key in ("streamlit_import_seconds", "first_render_seconds", "rerun_seconds")
+    }
+    result["loaded"] = runs[-1]["loaded"]
+    return result
+
+
+def bench_extraction(sizes, repeat):
+    results = []
+    for pages in sizes:
+        pdf = make_pdf(pages)
+        seconds, text = timed(lambda: extract_pdf(io.BytesIO(pdf)), repeat)
+        results.append(
+            {"format": "pdf", "pages": pages, "bytes": len(pdf), "seconds": seconds,
+             "pages_per_sec": pages / seconds, "chars": len(text)}
+        )
+
+        text = make_text(pages * 400)
+        docx = make_docx(text)
+        seconds, _ = timed(lambda: extract_doc(io.BytesIO(docx)), repeat)
+        results.append(
+            {"format": "docx", "words": pages * 400, "bytes": len(docx),
+             "seconds": seconds, "mb_per_sec": len(text) / seconds / 1e6}
+        )
+
+        raw = text.encode("utf-8")
+        seconds, _ = timed(lambda: extract_text(io.BytesIO(raw)), repeat)
+        results.append(
+            {"format": "txt", "words": pages * 400, "bytes": len(raw),
+             "seconds": seconds, "mb_per_sec": len(raw) / seconds / 1e6}
+        )
+    return results
+
+
+def bench_preprocessing(pages, repeat):
+    """
+    Tokens and chunks before and after preprocessing report-like PDFs.
+    """
+    results = []
+    for count in pages:
+        raw = extract_pdf(io.BytesIO(make_pdf(count, furniture=True)))
+        seconds, (clean, saved) = timed(lambda: preprocess(raw, **extractors[".pdf"]["preprocessing"]), repeat)
+        before = summarizer.estimate_tokens(raw)
+        results.append(
+            {"pages": count, "tokens_before": before, "tokens_saved": saved,
+             "saved_share": saved / before,
+             "chunks_before": len(summarizer.chunk_text(raw, summarizer.CHUNK_TOKENS)),
+             "chunks_after": len(summarizer.chunk_text(clean, summarizer.CHUNK_TOKENS)),
+             "seconds": seconds, "mb_per_sec": len(raw) / seconds / 1e6}
+        )
+    return results
+
+
+def bench_chunking(sizes, repeat):
+    results = []
+    for words in sizes:
+        text = make_text(words)
+        seconds, chunks = timed(lambda: summarizer.chunk_text(text, summarizer.CHUNK_TOKENS), repeat)
+        results.append(
+            {"words": words, "chars": len(text), "chunks": len(chunks),
+             "seconds": seconds, "mb_per_sec": len(text) / seconds / 1e6}
+        )
+    return results
+
+
+def bench_generation(sizes, latency, failure_rate):
+    results = []
+    for words in sizes:
+        text = make_text(words)
+        for name, generate in (
+            ("summary", summarizer.generate_summary),
+            ("quiz", summarizer.generate_quiz),
+        ):
+            model = FakeGenerativeModel(latency=latency, failure_rate=failure_rate)
+            started = time.perf_counter()
+            result = generate(text, model=model)
+            results.append(
+                {"stage": name, "words": words, "seconds": time.perf_counter() - started,
+                 "calls": model.calls, "prompt_chars": model.prompt_chars,
+                 "error": result.get("error")}
+            )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks")
+    parser.add_argument("--output", help="write results to this file instead of stdout")
+    parser.add_argument("--quick", action="store_true", help="small sizes only")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake model latency (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    # Measure real work: no response cache, and short retry backoff
+    summarizer.LLM_CACHE_PATH = ""
+    scheduler.scheduler = scheduler.Scheduler(backoff_base=0.01, backoff_max=0.1)
+
+    pages = [10, 100] if args.quick else [10, 100, 1000]
+    words = [5_000, 50_000] if args.quick else [5_000, 50_000, 500_000]
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency": args.latency,
+            "failure_rate": args.failure_rate,
+            "chunk_tokens": summarizer.CHUNK_TOKENS,
+            "max_concurrency": summarizer.MAX_CONCURRENCY,
+        },
+        "startup": bench_startup(args.repeat),
+        "extraction": bench_extraction(pages, args.repeat),
+        "preprocessing": bench_preprocessing(pages, args.repeat),
+        "chunking": bench_chunking(words, args.repeat),
+        "generation": bench_generation(words, args.latency, args.failure_rate),
+    }
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def content_key(*parts):
+    """
+    Hashes the given strings into a stable key. Parts are length-prefixed so
+    ("ab", "c") and ("a", "bc") never collide.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8")
+        digest.update(str(len(data)).encode("ascii") + b":")
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    A small SQLite-backed key/value store shared by every process on the host.
+    Entries older than max_age seconds are dropped, and the least recently
+    used entries are dropped, down to EVICT_TO of max_bytes, as soon as a
+    write takes the stored values over max_bytes. The running total is re-read from the database on every
+    eviction, so writes from other processes are counted too.
+    """
+
+    # Expired entries are swept, and the total re-read, at least this often
+    EVICT_EVERY = 100
+    # A full cache is trimmed to this share of max_bytes, so that the next
+    # writes don't each go over the limit again
+    EVICT_TO = 0.9
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, max_age=30 * 24 * 3600):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+        )
+        self.conn.commit()
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            self.conn.execute(
+                "UPDATE entries SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self.lock:
+            replaced = self.conn.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self.conn.commit()
+            self.writes += 1
+            self.total_bytes += len(value) - (replaced[0] if replaced else 0)
+            if self.total_bytes > self.max_bytes or self.writes % self.EVICT_EVERY == 0:
+                self.evict_locked(now)
+
+    def evict(self):
+        with self.lock:
+            self.evict_locked(time.time())
+
+    def evict_locked(self, now):
+        self.conn.execute(
+            "DELETE FROM entries WHERE created < ?", (now - self.max_age,)
+        )
+        total = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+        if total > self.max_bytes:
+            target = int(self.max_bytes * self.EVICT_TO)
+            stale = []
+            for key, size in self.conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed"
+            ):
+                stale.append((key,))
+                total -= size
+                if total <= target:
+                    break
+            self.conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+        self.total_bytes = total
+        self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.commit()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,126 @@
+"""
+Summarizes every PDF, DOCX and TXT file under a directory without Streamlit.
+
+    python cli.py archive/ --output summaries.jsonl --workers 8 --quiz
+
+One JSON object is appended per document as it finishes. Re-running with
+the same output file skips documents that already succeeded, so an
+interrupted run resumes where it stopped.
+
+Documents are processed on threads of this one process, so every worker
+shares the model call scheduler, the rate limit and the response cache.
+Large PDFs are still extracted on their own process pool.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from extraction import extract_file, supported_extensions
+import metrics
+import summarizer
+
+
+def find_documents(root):
+    extensions = supported_extensions()
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in extensions:
+                yield os.path.join(dirpath, filename)
+
+
+def load_finished(output):
+    finished = set()
+    if not os.path.exists(output):
+        return finished
+    with open(output, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by an interrupted run
+            if "error" not in record:
+                finished.add(record["path"])
+    return finished
+
+
+def process_document(path, quiz=False):
+    started = time.time()
+    record = {"path": path}
+    metrics.current_trace.set(path)
+    try:
+        extension = os.path.splitext(path)[1].lower()
+        with open(path, "rb") as f, metrics.span(
+            "extract", file_format=extension.lstrip("."), bytes=os.path.getsize(path)
+        ):
+            text = extract_file(f, path)
+        if not text.strip():
+            raise ValueError("no text could be extracted")
+        record.update(summarizer.generate_summary(text))
+        if quiz and "error" not in record:
+            quiz_data = summarizer.generate_quiz(text)
+            if "error" in quiz_data:
+                record["error"] = quiz_data["error"]
+            else:
+                record["quiz"] = quiz_data["quiz"]
+    except Exception as e:
+        record["error"] = str(e)
+    record["seconds"] = round(time.time() - started, 2)
+    stages = {}
+    tokens_saved = 0
+    for stage_span in metrics.trace_spans(path):
+        stage = stage_span["stage"]
+        stages[stage] = round(stages.get(stage, 0) + stage_span["seconds"], 3)
+        tokens_saved += stage_span.get("tokens_saved", 0)
+    record["stages"] = stages
+    record["tokens_saved"] = tokens_saved
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("input", help="directory to search for documents")
+    parser.add_argument("--output", default="summaries.jsonl")
+    parser.add_argument(
+        "--workers", type=int, default=4, help="documents processed at once"
+    )
+    parser.add_argument("--quiz", action="store_true", help="also generate a quiz")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+
+    finished = load_finished(args.output)
+    paths = [p for p in find_documents(args.input) if p not in finished]
+    print(f"{len(paths)} documents to process, {len(finished)} already done", file=sys.stderr)
+
+    started = time.time()
+    failures = 0
+    with open(args.output, "a", encoding="utf-8") as out, ThreadPoolExecutor(
+        max_workers=args.workers
+    ) as pool:
+        futures = [pool.submit(process_document, p, args.quiz) for p in paths]
+        for done, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            if "error" in record:
+                failures += 1
+                print(f"[{done}/{len(paths)}] FAILED {record['path']}: {record['error']}", file=sys.stderr)
+            else:
+                print(f"[{done}/{len(paths)}] {record['path']}", file=sys.stderr)
+
+    minutes = (time.time() - started) / 60
+    rate = len(paths) / minutes if minutes else 0.0
+    print(
+        f"Processed {len(paths)} documents in {minutes:.1f} min "
+        f"({rate:.1f} docs/min), {failures} failed",
+        file=sys.stderr,
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+from dotenv import load_dotenv
+import hashlib
+import heapq
+import os
+import re
+
+load_dotenv()
+
+# Chunks at least this similar (estimated Jaccard similarity of word 3-grams)
+# share one model call; 0 disables near-duplicate matching
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+# Shorter chunks are only matched when they are exact copies
+DEDUP_MIN_WORDS = 50
+SHINGLE_WORDS = 3
+SKETCH_SIZE = 128
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def minhash(words):
+    """
+    Bottom-k MinHash sketch: the SKETCH_SIZE smallest hashes of the word
+    3-grams in words. Hashes are only comparable within one process.
+    """
+    shingles = {
+        " ".join(words[i : i + SHINGLE_WORDS])
+        for i in range(max(1, len(words) - SHINGLE_WORDS + 1))
+    }
+    return frozenset(heapq.nsmallest(SKETCH_SIZE, map(hash, shingles)))
+
+
+def similarity(a, b):
+    """
+    Estimated Jaccard similarity of the shingle sets behind two sketches.
+    """
+    both = a & b
+    if not both:
+        return 0.0
+    union = sorted(a | b)[:SKETCH_SIZE]
+    return sum(1 for h in union if h in both) / len(union)
+
+
+def find_duplicates(chunks, threshold=DEDUP_THRESHOLD):
+    """
+    Returns, for every chunk, the index of the chunk whose model result it
+    can reuse: itself, or the first earlier chunk that is an exact copy or
+    at least threshold similar by MinHash.
+    """
+    assignments = []
+    exact = {}
+    fingerprints = []
+    for index, chunk in enumerate(chunks):
+        words = WORD_PATTERN.findall(chunk.lower())
+        digest = hashlib.sha256(" ".join(words).encode()).digest()
+        if digest in exact:
+            assignments.append(exact[digest])
+            continue
+
+        match = index
+        if threshold and len(words) >= DEDUP_MIN_WORDS:
+            fingerprint = minhash(words)
+            for other, other_fingerprint in fingerprints:
+                # The estimate can't reach threshold without this many shared
+                # hashes; short chunks have sketches of fewer than SKETCH_SIZE
+                size = min(SKETCH_SIZE, len(fingerprint), len(other_fingerprint))
+                if len(fingerprint & other_fingerprint) < threshold * size:
+                    continue
+                if similarity(fingerprint, other_fingerprint) >= threshold:
+                    match = other
+                    break
+            if match == index:
+                fingerprints.append((index, fingerprint))
+        exact[digest] = match
+        assignments.append(match)
+    return assignments
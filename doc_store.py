@@ -0,0 +1,166 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+import os
+import threading
+import time
+
+from cache import content_key
+from metrics import register_collector
+
+load_dotenv()
+
+DOC_STORE_DIR = os.getenv("DOC_STORE_DIR", ".cache/documents")
+# Decoded texts kept in memory across all sessions
+DOC_STORE_MEMORY_MB = int(os.getenv("DOC_STORE_MEMORY_MB", "256"))
+# Documents no session has touched for this long are deleted from disk
+DOC_STORE_TTL = int(os.getenv("DOC_STORE_TTL", str(24 * 3600)))
+SESSION_QUOTA_MB = int(os.getenv("SESSION_QUOTA_MB", "64"))
+SESSION_MAX_DOCUMENTS = int(os.getenv("SESSION_MAX_DOCUMENTS", "5"))
+
+
+class DocumentStore:
+    """
+    Extracted texts on disk, keyed by content hash, so sessions only hold a key.
+
+    Decoded texts are kept in a shared LRU bounded by memory_bytes, which is
+    what bounds memory; texts evicted from it are read back from disk whole
+    when next needed. Each session may reference at most
+    session_documents documents and session_bytes of text; older references
+    are dropped when a session goes over. Files that no live session
+    references and that were not read for ttl seconds are swept from disk.
+    """
+
+    def __init__(
+        self,
+        directory=DOC_STORE_DIR,
+        memory_bytes=DOC_STORE_MEMORY_MB * 1024 * 1024,
+        ttl=DOC_STORE_TTL,
+        session_bytes=SESSION_QUOTA_MB * 1024 * 1024,
+        session_documents=SESSION_MAX_DOCUMENTS,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.ttl = ttl
+        self.session_bytes = session_bytes
+        self.session_documents = session_documents
+        self.lock = threading.Lock()
+        self.hot = OrderedDict()
+        self.hot_bytes = 0
+        self.sessions = {}
+        self.last_sweep = 0.0
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def put(self, text, session):
+        data = text.encode("utf-8")
+        if len(data) > self.session_bytes:
+            raise ValueError(
+                f"Document is too large ({len(data) // (1024 * 1024)} MB); "
+                f"the limit is {self.session_bytes // (1024 * 1024)} MB"
+            )
+        key = content_key(text)
+        path = self.path(key)
+        if not os.path.exists(path):
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        os.utime(path)
+
+        with self.lock:
+            self.remember(key, text)
+            refs, _ = self.sessions.pop(session, (OrderedDict(), 0))
+            refs.pop(key, None)
+            refs[key] = len(data)
+            while (
+                len(refs) > self.session_documents
+                or sum(refs.values()) > self.session_bytes
+            ):
+                refs.popitem(last=False)
+            self.sessions[session] = (refs, time.time())
+        self.maybe_sweep()
+        return key
+
+    def load(self, key, session=None):
+        with self.lock:
+            if session in self.sessions:
+                refs, _ = self.sessions[session]
+                self.sessions[session] = (refs, time.time())
+            if key in self.hot:
+                self.hot.move_to_end(key)
+                return self.hot[key]
+
+        path = self.path(key)
+        with open(path, encoding="utf-8", newline="") as f:
+            text = f.read()
+        os.utime(path)
+        with self.lock:
+            self.remember(key, text)
+        return text
+
+    def remember(self, key, text):
+        if len(text) > self.memory_bytes:
+            return
+        if key not in self.hot:
+            self.hot_bytes += len(text)
+        self.hot[key] = text
+        self.hot.move_to_end(key)
+        while self.hot_bytes > self.memory_bytes:
+            _, evicted = self.hot.popitem(last=False)
+            self.hot_bytes -= len(evicted)
+
+    def release(self, session):
+        with self.lock:
+            self.sessions.pop(session, None)
+
+    def maybe_sweep(self):
+        if time.time() - self.last_sweep > min(self.ttl, 3600):
+            self.sweep()
+
+    def sweep(self):
+        now = time.time()
+        with self.lock:
+            self.last_sweep = now
+            idle = [s for s, (_, seen) in self.sessions.items() if now - seen > self.ttl]
+            for session in idle:
+                del self.sessions[session]
+            referenced = {key for refs, _ in self.sessions.values() for key in refs}
+        for filename in os.listdir(self.directory):
+            key = filename.split(".")[0]
+            path = os.path.join(self.directory, filename)
+            try:
+                if key not in referenced and now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hot_documents": len(self.hot),
+                "hot_bytes": self.hot_bytes,
+                "sessions": len(self.sessions),
+            }
+
+
+store = None
+store_lock = threading.Lock()
+
+
+def get_store():
+    global store
+    with store_lock:
+        if store is None:
+            store = DocumentStore()
+    return store
+
+
+def store_metrics():
+    if store is None:
+        return {}
+    return {f"doc_store_{name}": value for name, value in store.stats().items()}
+
+
+register_collector(store_metrics)
@@ -0,0 +1,199 @@
+from dotenv import load_dotenv
+import hashlib
+import io
+import os
+import threading
+
+from cache import DiskCache, content_key
+from metrics import annotate, register_collector
+from preprocess import PAGE_BREAK, preprocess
+
+load_dotenv()
+
+# PDFs with at least this many pages are extracted across a process pool
+PARALLEL_MIN_PAGES = int(os.getenv("PARALLEL_MIN_PAGES", "200"))
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+
+# Bump when extractor output changes, so cached extractions are not reused
+EXTRACTOR_VERSION = "3"
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", ".cache/extractions.sqlite3")
+EXTRACTION_CACHE_MAX_MB = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "1024"))
+# Strip page furniture and layout whitespace from extracted text; 0 keeps it as is
+PREPROCESS = os.getenv("PREPROCESS", "1") == "1"
+
+
+# -------------------- FORMAT REGISTRY --------------------
+extractors = {}
+extensions_by_mime_type = {}
+
+
+def register_extractor(extension, extract, mime_types=(), strip_repeated=False, dehyphenate=True):
+    """
+    Registers extract(file) -> text for files with this extension, or with
+    one of mime_types when the name has no known extension. extract should
+    import its parsing library itself, so a format costs nothing until a
+    file of that type arrives. strip_repeated and dehyphenate are passed to
+    preprocess() for the format.
+    """
+    extractors[extension] = {
+        "extract": extract,
+        "preprocessing": {"strip_repeated": strip_repeated, "dehyphenate": dehyphenate},
+    }
+    for mime_type in mime_types:
+        extensions_by_mime_type[mime_type] = extension
+
+
+def supported_extensions():
+    return list(extractors)
+
+
+def file_extension(filename, mime_type=None):
+    """
+    The registered extension a file is extracted as, from its name or else
+    its MIME type. Raises ValueError for unsupported files.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in extractors:
+        extension = extensions_by_mime_type.get(mime_type, extension)
+    if extension not in extractors:
+        raise ValueError(f"Unsupported file type: {extension or filename}")
+    return extension
+
+
+# -------------------- PDF ENGINE --------------------
+def read_bytes(uploaded_file):
+    if isinstance(uploaded_file, (bytes, bytearray)):
+        return bytes(uploaded_file)
+    if hasattr(uploaded_file, "getvalue"):
+        return uploaded_file.getvalue()
+    if hasattr(uploaded_file, "read"):
+        return uploaded_file.read()
+    with open(uploaded_file, "rb") as f:
+        return f.read()
+
+
+def iter_pdf_pages(reader, start=0, stop=None):
+    """
+    Yields the text of each page in [start, stop).
+    Pages without a text layer yield an empty string.
+    """
+    for page in reader.pages[start:stop]:
+        yield page.extract_text() or ""
+
+
+def extract_page_range(data, start, stop):
+    from PyPDF2 import PdfReader
+
+    return list(iter_pdf_pages(PdfReader(io.BytesIO(data)), start, stop))
+
+
+def page_ranges(page_count, parts):
+    size = -(-page_count // parts)
+    return [(i, min(i + size, page_count)) for i in range(0, page_count, size)]
+
+
+def extract_pdf_pages(data, workers=EXTRACT_WORKERS, min_pages=PARALLEL_MIN_PAGES):
+    """
+    Yields page texts in order. Large PDFs are split into page ranges that
+    are parsed by a process pool, each worker opening its own reader.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    page_count = len(reader.pages)
+    if workers <= 1 or page_count < min_pages:
+        yield from iter_pdf_pages(reader)
+        return
+
+    ranges = page_ranges(page_count, workers * 2)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(extract_page_range, data, a, b) for a, b in ranges]
+        for future in futures:
+            yield from future.result()
+
+
+# -------------------- FILE EXTRACTORS --------------------
+def extract_pdf(uploaded_file):
+    return PAGE_BREAK.join(extract_pdf_pages(read_bytes(uploaded_file)))
+
+
+def extract_doc(uploaded_file):
+    import mammoth
+
+    return mammoth.extract_raw_text(uploaded_file).value
+
+
+def extract_text(uploaded_file):
+    return read_bytes(uploaded_file).decode("utf-8")
+
+
+# Only PDFs have pages with running headers and footers; Word documents
+# don't break words across lines
+register_extractor(".pdf", extract_pdf, ["application/pdf"], strip_repeated=True)
+register_extractor(
+    ".docx",
+    extract_doc,
+    ["application/vnd.openxmlformats-officedocument.wordprocessingml.document"],
+    dehyphenate=False,
+)
+register_extractor(".txt", extract_text, ["text/plain"])
+
+
+# -------------------- EXTRACTION CACHE --------------------
+extraction_cache = None
+extraction_cache_lock = threading.Lock()
+
+
+def get_extraction_cache():
+    global extraction_cache
+    with extraction_cache_lock:
+        if extraction_cache is None and EXTRACTION_CACHE_PATH:
+            extraction_cache = DiskCache(
+                EXTRACTION_CACHE_PATH,
+                max_bytes=EXTRACTION_CACHE_MAX_MB * 1024 * 1024,
+                max_age=365 * 24 * 3600,
+            )
+    return extraction_cache
+
+
+def extraction_cache_metrics():
+    if extraction_cache is None:
+        return {}
+    return {f"extraction_cache_{k}": v for k, v in extraction_cache.stats().items()}
+
+
+register_collector(extraction_cache_metrics)
+
+
+def extract_raw(data, extension):
+    extract = extractors[extension]["extract"]
+    cache = get_extraction_cache()
+    if cache is None:
+        return extract(io.BytesIO(data))
+
+    key = content_key(EXTRACTOR_VERSION, extension, hashlib.sha256(data).hexdigest())
+    text = cache.get(key)
+    if text is None:
+        text = extract(io.BytesIO(data))
+        cache.set(key, text)
+    else:
+        annotate(cache_hits=1)
+    return text
+
+
+def extract_file(uploaded_file, filename, mime_type=None):
+    """
+    Extracts text with the extractor registered for filename's extension
+    (or mime_type), then preprocesses it with that format's options. Raw
+    extractions are cached by a hash of the file bytes and EXTRACTOR_VERSION,
+    so a repeat upload of the same file skips parsing in any session or
+    process. Tokens saved by preprocessing are added to the current span.
+    """
+    extension = file_extension(filename, mime_type)
+    text = extract_raw(read_bytes(uploaded_file), extension)
+    if not PREPROCESS:
+        return text
+    text, tokens_saved = preprocess(text, **extractors[extension]["preprocessing"])
+    annotate(tokens_saved=tokens_saved)
+    return text
@@ -0,0 +1,103 @@
+"""
+An offline stand-in for genai.GenerativeModel, for benchmarks and load tests.
+Replies are built from the prompt itself, so runs are deterministic and need
+no API key.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+
+
+class FakeThrottleError(Exception):
+    code = 429
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """
+    Answers summary, reduce, quiz, question and packed prompts after latency seconds.
+    A seeded failure_rate share of calls raise FakeThrottleError like a 429
+    would. With stream=True the reply comes back in stream_pieces fragments,
+    the first after a fifth of the latency; streaming=False makes the model
+    reject stream=True like a client without streaming support.
+    """
+
+    def __init__(
+        self,
+        model_name="fake",
+        latency=0.0,
+        failure_rate=0.0,
+        seed=0,
+        streaming=True,
+        stream_pieces=20,
+    ):
+        self.model_name = model_name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.streaming = streaming
+        self.stream_pieces = stream_pieces
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.prompt_chars = 0
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        if stream and not self.streaming:
+            raise TypeError("generate_content() got an unexpected keyword argument 'stream'")
+        with self.lock:
+            self.calls += 1
+            self.prompt_chars += len(prompt)
+            fail = self.random.random() < self.failure_rate
+        if stream and not fail:
+            return self.stream(json.dumps(self.reply(prompt)))
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise FakeThrottleError("429 Resource has been exhausted (fake)")
+        return FakeResponse(json.dumps(self.reply(prompt)))
+
+    def stream(self, text):
+        size = -(-len(text) // self.stream_pieces)
+        for n, start in enumerate(range(0, len(text), size)):
+            if self.latency:
+                time.sleep(self.latency * (0.2 if n == 0 else 0.8 / self.stream_pieces))
+            yield FakeResponse(text[start : start + size])
+
+    def reply(self, prompt):
+        sections = re.split(r"^### Section \d+\n", prompt, flags=re.M)
+        if len(sections) > 1:
+            return {"results": [self.reply(sections[0] + s) for s in sections[1:]]}
+        content = prompt.rsplit(":\n", 1)[-1]
+        words = content.split()
+        if '"answer"' in prompt:
+            return {"answer": " ".join(words[:60]), "excerpts": [1]}
+        if '"quiz"' in prompt:
+            match = re.search(r"exactly (\d+)", prompt)
+            count = int(match.group(1)) if match else 10
+            return {"quiz": [fake_question(words, i) for i in range(count)]}
+        title = " ".join(words[:6]) or "Untitled"
+        return {
+            "title": title,
+            "topics": sorted({w.strip(".,;:!?").title() for w in words[:40] if len(w) > 6})[:5],
+            "summary": " ".join(words[:80]),
+        }
+
+
+def fake_question(words, index):
+    subject = words[(index * 7) % len(words)] if words else "content"
+    options = [f"{subject} {letter}" for letter in "ABCD"]
+    return {
+        "question": f"Question {index + 1} about {subject}?",
+        "options": options,
+        "correct_answer": options[index % 4],
+        "explanation": f"The document discusses {subject}.",
+        "topic": subject.strip(".,;:!?").title(),
+        "difficulty": ("easy", "medium", "hard")[index % 3],
+    }
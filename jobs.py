@@ -0,0 +1,97 @@
+from dotenv import load_dotenv
+import contextvars
+import os
+import threading
+import time
+
+load_dotenv()
+
+# Finished jobs are kept this long so reruns and repeat uploads reattach to them
+JOB_TTL = int(os.getenv("JOB_TTL", "3600"))
+
+
+class Job:
+    """
+    A generate function running on a background thread.
+    The function reports progress through update(), which records how many
+    units are done, any partial result for the unit that just finished and
+    any named details about the job as a whole.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.done = 0
+        self.total = 0
+        self.partials = {}
+        self.details = {}
+        self.result = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def update(self, done, total, index=None, partial=None, **details):
+        with self.lock:
+            self.done = done
+            self.total = total
+            if partial is not None:
+                self.partials[index] = partial
+            self.details.update(details)
+
+    def is_finished(self):
+        return self.finished is not None
+
+    def failed(self):
+        return self.is_finished() and (
+            self.result is None or "error" in self.result
+        )
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "done": self.done,
+                "total": self.total,
+                "partials": [self.partials[i] for i in sorted(self.partials)],
+                "details": dict(self.details),
+                "finished": self.is_finished(),
+                "result": self.result,
+            }
+
+    def run(self, fn, args):
+        try:
+            self.result = fn(*args, progress=self.update)
+        except Exception as e:
+            self.result = {"error": str(e)}
+        self.finished = time.time()
+
+
+jobs = {}
+jobs_lock = threading.Lock()
+
+
+def prune_jobs(now):
+    for key in [k for k, job in jobs.items() if job.finished and now - job.finished > JOB_TTL]:
+        del jobs[key]
+
+
+def start_job(key, fn, *args, restart=False):
+    """
+    Returns the job for key, starting fn(*args) in the background unless a
+    job for key already exists. A failed job is kept, so its error can be
+    shown, and only started again with restart (a retry asked for by the user).
+    """
+    with jobs_lock:
+        prune_jobs(time.time())
+        job = jobs.get(key)
+        if job is None or (restart and job.failed()):
+            job = Job(key)
+            jobs[key] = job
+            # The job inherits the caller's context, e.g. the scheduler session
+            context = contextvars.copy_context()
+            threading.Thread(
+                target=context.run, args=(job.run, fn, args), daemon=True
+            ).start()
+        return job
+
+
+def get_job(key):
+    with jobs_lock:
+        return jobs.get(key)
@@ -0,0 +1,280 @@
+"""
+Load test: many simultaneous users walking home -> summary -> quiz -> results.
+
+    python loadtest.py --sessions 1,4,16 --output load.json
+    python loadtest.py --sessions 8 --pages 50 --latency 1.0 --failure-rate 0.05
+
+Every simulated user is a streamlit AppTest session running main.py in this
+process, so sessions share the job threads, scheduler, document store and
+indexes exactly as they do behind one Streamlit server. Each session uploads
+its own generated PDF (so no session is served from another's work), waits
+for the summary, starts a quiz, answers every question and reaches the
+results page. Model calls go to the offline stub backend.
+
+For each concurrency level the report gives p50/p95/p99 per step, the error
+rate, peak RSS and session state size (memory), CPU seconds per wall second
+(extraction and rendering), and time spent in each pipeline stage, including
+waiting for a model call slot (the model).
+"""
+
+import os
+import tempfile
+
+# The app reads these when its modules are imported
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("LLM_CACHE_PATH", "")
+os.environ.setdefault("EXTRACTION_CACHE_PATH", "")
+TEMP_STORE = None
+if "DOC_STORE_DIR" not in os.environ:
+    TEMP_STORE = os.environ["DOC_STORE_DIR"] = tempfile.mkdtemp(prefix="loadtest-")
+
+import argparse
+import itertools
+import json
+import pickle
+import platform
+import resource
+import shutil
+import threading
+import time
+
+from streamlit import config
+from streamlit.runtime.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.util import build_mock_config_get_option
+
+from benchmark import make_pdf
+import metrics
+import summarizer
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+STEPS = ("home", "summary", "quiz", "answer")
+# Session state that grows with the documents and quiz of a session
+SESSION_KEYS = (
+    "summary_data",
+    "quiz_data",
+    "uploads",
+    "corpus_data",
+    "answers",
+    "seen_questions",
+    "user_answers",
+)
+RSS_SAMPLE_SECONDS = 0.05
+
+session_numbers = itertools.count()
+
+
+def share_runtime():
+    """
+    AppTest sets up process-wide state for each run (a mock Runtime and the
+    testing config option) and undoes it afterwards, under the other
+    sessions still running, and compiles the script again on every run.
+    Keeping that state in place and sharing one script cache, as a
+    Streamlit server does, lets sessions run side by side.
+    """
+    original = Runtime.instance.__func__
+    get_bytecode = ScriptCache.get_bytecode
+    script_cache = ScriptCache()
+    installed = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            installed[:] = [cls._instance]
+            return cls._instance
+        if installed:
+            return installed[0]
+        return original(cls)
+
+    Runtime.instance = classmethod(instance)
+    ScriptCache.get_bytecode = lambda self, path: get_bytecode(script_cache, path)
+    config.get_option = build_mock_config_get_option({"global.appTest": True})
+
+
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak rather than current, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def state_bytes(at):
+    size = 0
+    for key in SESSION_KEYS:
+        if key in at.session_state:
+            size += len(pickle.dumps(at.session_state[key]))
+    return size
+
+
+def find_button(at, label):
+    return next(button for button in at.button if label in button.label)
+
+
+# -------------------- SESSIONS --------------------
+def run_session(number, pages, timeout):
+    """
+    One user's visit. Returns step timings, the session state size at the
+    end and the first error, if any.
+    """
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    steps = {step: [] for step in STEPS}
+    result = {"steps": steps, "state_bytes": 0, "error": None}
+
+    def step(name, action, page):
+        started = time.perf_counter()
+        action()
+        steps[name].append(time.perf_counter() - started)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        if at.error:
+            raise RuntimeError(at.error[0].value)
+        if at.session_state["page"] != page:
+            raise RuntimeError(f"{name}: expected page {page}, got {at.session_state['page']}")
+
+    try:
+        step("home", at.run, "home")
+        data = bytes(make_pdf(pages, seed=number, furniture=True))
+        uploader = at.get("file_uploader")[0]
+        step(
+            "summary",
+            lambda: uploader.upload(f"session-{number}.pdf", data, "application/pdf").run(),
+            "summary",
+        )
+        step("quiz", lambda: find_button(at, "Generate Quiz").click().run(), "quiz")
+
+        questions = at.session_state["quiz_data"]["quiz"]
+        for i, question in enumerate(questions):
+            last = i == len(questions) - 1
+
+            def answer():
+                at.radio(key=f"quiz_answer_{i}").set_value(question["options"][0]).run()
+                find_button(at, "Finish Quiz" if last else "Next →").click().run()
+
+            step("answer", answer, "results" if last else "quiz")
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["state_bytes"] = state_bytes(at)
+    return result
+
+
+def run_level(sessions, pages, timeout):
+    with metrics.lock:
+        stage_seconds = {stage: t["seconds"] for stage, t in metrics.totals.items()}
+        queue_seconds = metrics.counters[("model_call", "queue_seconds")]
+    baseline_rss = current_rss()
+    peak_rss = [baseline_rss]
+    done = threading.Event()
+
+    def sample_rss():
+        while not done.wait(RSS_SAMPLE_SECONDS):
+            peak_rss[0] = max(peak_rss[0], current_rss())
+
+    results = [None] * sessions
+
+    def visit(slot, number):
+        results[slot] = run_session(number, pages, timeout)
+
+    threads = [
+        threading.Thread(target=visit, args=(slot, next(session_numbers)), daemon=True)
+        for slot in range(sessions)
+    ]
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    started, cpu_started = time.perf_counter(), cpu_seconds()
+    sampler.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall, cpu = time.perf_counter() - started, cpu_seconds() - cpu_started
+    done.set()
+    sampler.join()
+    peak_rss[0] = max(peak_rss[0], current_rss())
+
+    with metrics.lock:
+        stages = {
+            stage: round(t["seconds"] - stage_seconds.get(stage, 0.0), 3)
+            for stage, t in metrics.totals.items()
+        }
+        stages["model_queue"] = round(
+            metrics.counters[("model_call", "queue_seconds")] - queue_seconds, 3
+        )
+
+    errors = [r["error"] for r in results if r["error"]]
+    return {
+        "sessions": sessions,
+        "seconds": round(wall, 3),
+        "error_rate": len(errors) / sessions,
+        "errors": sorted(set(errors))[:5],
+        "steps": {
+            step: {
+                "count": len(values),
+                "p50": round(metrics.percentile(values, 0.5), 3),
+                "p95": round(metrics.percentile(values, 0.95), 3),
+                "p99": round(metrics.percentile(values, 0.99), 3),
+                "max": round(max(values, default=0.0), 3),
+            }
+            for step in STEPS
+            for values in [[v for r in results for v in r["steps"][step]]]
+        },
+        "peak_rss_mb": round(peak_rss[0] / 2**20, 1),
+        "rss_growth_mb": round((peak_rss[0] - baseline_rss) / 2**20, 1),
+        "session_state_kb": round(
+            sum(r["state_bytes"] for r in results) / sessions / 1024, 1
+        ),
+        "cpu_per_wall_second": round(cpu / wall, 2) if wall else 0.0,
+        "stage_seconds": {stage: s for stage, s in stages.items() if s > 0},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-session load test")
+    parser.add_argument("--output", help="write results to this file instead of stdout")
+    parser.add_argument(
+        "--sessions", default="1,2,4,8", help="comma-separated concurrency levels"
+    )
+    parser.add_argument("--pages", type=int, default=20, help="pages per uploaded PDF")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake model latency (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=600, help="per-step timeout (s)")
+    args = parser.parse_args(argv)
+
+    # Read when the stub client is first created
+    os.environ["STUB_LATENCY"] = str(args.latency)
+    os.environ["STUB_FAILURE_RATE"] = str(args.failure_rate)
+    share_runtime()
+
+    levels = [int(n) for n in args.sessions.split(",") if n.strip()]
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "latency": args.latency,
+            "failure_rate": args.failure_rate,
+            "pages": args.pages,
+            "max_concurrency": summarizer.MAX_CONCURRENCY,
+            "quiz_questions": summarizer.QUIZ_QUESTIONS,
+        },
+        "levels": [run_level(n, args.pages, args.timeout) for n in levels],
+    }
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+    if TEMP_STORE:
+        shutil.rmtree(TEMP_STORE, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
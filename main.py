@@ -1,13 +1,22 @@
 import streamlit as st
-from PyPDF2 import PdfReader
-import google.generativeai as genai
-import mammoth
-import json
 from dotenv import load_dotenv
-import re
+import hashlib
+import logging
 import os
+import time
+import uuid
+
+from doc_store import get_store
+from extraction import extract_file, supported_extensions
+from jobs import get_job, start_job
+from scheduler import current_session
+from topics import chunk_ranges
+import metrics
+import question_bank
+import summarizer
 
 load_dotenv()
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
 
 # Custom CSS for better UI
 st.markdown(
@@ -120,164 +129,179 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-SUMMARY_SYSTEM_MESSAGE = """
-You are an intelligent AI assistant. Your task is to process user-provided content and create a comprehensive summary.
-
-Generate a summary in the following JSON format:
-{
-  "title": "Main content or subject the file focuses on",
-  "topics": ["List of all key topics covered at a high level. Only include main topics, not subtypes or granular details. For example, for memory consistency models, just include 'Memory Consistency Models', not strong, weak, or other types."],
-  "summary": "A clear and detailed summary covering important information, insights, or events. Make this comprehensive and well-structured."
-}
-
-The response must be strictly valid JSON (no extra text, no markdown). Only provide high-level topics in the topics array.
-"""
-
-QUIZ_SYSTEM_MESSAGE = """
-You are an intelligent quiz generator. Based on the provided content, generate exactly 10 multiple-choice questions.
-
-Generate quizzes in the following JSON format:
-{
-  "quiz": [
-    {
-      "question": "Clear MCQ question based on the content",
-      "options": ["Option A", "Option B", "Option C", "Option D"],
-      "correct_answer": "Correct option (must match exactly one of the options)",
-      "explanation": "Brief explanation why this answer is correct"
-    }
-  ]
-}
+# -------------------- AI FUNCTIONS --------------------
+# Generation runs as background jobs keyed by document hash; pages poll them
+POLL_SECONDS = 1
+# Polled faster while a reply is streaming in, so text appears as it arrives
+STREAM_POLL_SECONDS = 0.25
 
-Requirements:
-- Generate exactly 10 questions
-- Each question must have exactly 4 options
-- Questions should cover different aspects of the content
-- Vary the difficulty level
-- The response must be strictly valid JSON (no extra text, no markdown).
-"""
 
-model_name = "gemini-2.0-flash"
+# Sessions only hold the document key; jobs load the text from the store
+def summarize_document(doc_key, progress=None):
+    return summarizer.generate_summary(get_store().load(doc_key), progress=progress)
 
-# -------------------- FILE EXTRACTORS --------------------
 
+def quiz_document(doc_key, topics=(), progress=None):
+    return summarizer.generate_quiz(
+        get_store().load(doc_key), progress=progress, topics=list(topics)
+    )
 
-def extract_pdf(uploaded_file):
-    extracted_text = ""
-    reader = PdfReader(uploaded_file)
-    for page in reader.pages:
-        extracted_text += page.extract_text()
-    return extracted_text
 
+def process_upload(name, data, session_id, progress=None):
+    """
+    Extracts, stores and summarizes one of several uploaded files.
+    """
+    with metrics.span("extract", file_format=name.rsplit(".", 1)[-1], bytes=len(data)):
+        text = extract_file(data, name)
+    if not text.strip():
+        return {"error": "No text could be extracted", "name": name}
+    doc_key = get_store().put(text, session_id)
+    result = summarizer.generate_summary(text, progress=progress)
+    return dict(result, name=name, doc_key=doc_key)
 
-def extract_doc(uploaded_file):
-    pages = mammoth.extract_raw_text(uploaded_file)
-    text = pages.value
-    extracted_text = re.sub(r"\s+", " ", text)
-    return extracted_text
 
+def summarize_corpus(documents, progress=None):
+    return summarizer.generate_corpus_summary(documents, progress=progress)
 
-def extract_text(uploaded_file):
-    lines = uploaded_file.readlines()
-    decoded_lines = [line.decode("utf-8").strip() for line in lines]
-    return " ".join(decoded_lines)
 
+def corpus_text(documents):
+    """
+    The per-document summaries as one text, which the combined quiz is
+    generated from instead of the full documents.
+    """
+    return "\n\n".join(
+        f"{d['name']}: {d.get('title', '')}\n\n{d['summary']}" for d in documents
+    )
 
-# -------------------- AI FUNCTIONS --------------------
+
+def fill_bank(doc_key, topics, progress=None):
+    return question_bank.build_bank(
+        doc_key, get_store().load(doc_key), topics, progress=progress
+    )
+
+
+def ask_document(doc_key, question):
+    return summarizer.answer_question(get_store().load(doc_key), question)
 
 
-# -------------------- HELPER: CHUNKING --------------------
-def chunk_text(text, max_tokens=2000):
+def section_label(ranges, noun="Section"):
+    parts = [
+        f"{start + 1}" if start == end else f"{start + 1}–{end + 1}"
+        for start, end in ranges
+    ]
+    return f"{noun}{'s' if len(parts) > 1 or ranges[0][0] != ranges[0][1] else ''} {', '.join(parts)}"
+
+
+def section_excerpts(doc_key, ranges, chunk_tokens, max_chars=600):
     """
-    Splits the text into smaller chunks.
-    max_tokens is approximate number of words per chunk.
+    Yields (section_number, excerpt) for the chunks in ranges, re-chunking
+    the stored text only as far as the last section needed.
     """
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), max_tokens):
-        chunk = " ".join(words[i : i + max_tokens])
-        chunks.append(chunk)
-    return chunks
-
-
-# -------------------- AI FUNCTIONS WITH CHUNKING --------------------
-@st.cache_data(show_spinner=False)
-def generate_summary(text):
-    try:
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        chunks = chunk_text(text, max_tokens=1000)  # smaller chunks for long docs
-        chunk_summaries = []
-
-        for chunk in chunks:
-            prompt = f"{SUMMARY_SYSTEM_MESSAGE}\n\nContent to summarize:\n{chunk}"
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content(
-                prompt,
-                generation_config=genai.GenerationConfig(
-                    response_mime_type="application/json",
-                ),
-            )
-            formatted_response = response.text.replace("```json", "").replace("```", "")
-            chunk_summary = json.loads(formatted_response)
-            chunk_summaries.append(chunk_summary)
-
-        # Combine chunk summaries into a final summary
-        combined_summary_text = " ".join([c["summary"] for c in chunk_summaries])
-        combined_topics = []
-        for c in chunk_summaries:
-            for t in c.get("topics", []):
-                if t not in combined_topics:
-                    combined_topics.append(t)
-
-        final_summary = {
-            "title": chunk_summaries[0].get("title", "Untitled"),
-            "topics": combined_topics,
-            "summary": combined_summary_text,
-        }
-        return final_summary
-
-    except Exception as e:
-        print(str(e))
-        return {"error": str(e)}
-
-@st.cache_data(show_spinner=False)
-def generate_quiz(text):
-    try:
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        chunks = chunk_text(text, max_tokens=1000)
-        all_quizzes = []
-
-        for chunk in chunks:
-            prompt = f"{QUIZ_SYSTEM_MESSAGE}\n\nContent for quiz generation:\n{chunk}"
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content(
-                prompt,
-                generation_config=genai.GenerationConfig(
-                    response_mime_type="application/json",
-                ),
-            )
-            formatted_response = response.text.replace("```json", "").replace("```", "")
-            chunk_quiz = json.loads(formatted_response)
-            all_quizzes.extend(chunk_quiz.get("quiz", []))
+    wanted = {i for start, end in ranges for i in range(start, end + 1)}
+    chunks = summarizer.iter_chunks(
+        get_store().load(doc_key), chunk_tokens, summarizer.CHUNK_OVERLAP
+    )
+    for index, chunk in enumerate(chunks):
+        if index in wanted:
+            yield index + 1, chunk[:max_chars] + ("…" if len(chunk) > max_chars else "")
+        if index >= max(wanted):
+            break
+
+
+def upload_job(name, data):
+    session_id = st.session_state.session_id
+    key = ("upload", session_id, hashlib.sha256(data).hexdigest())
+    start_job(key, process_upload, name, data, session_id)
+    return {"name": name, "job": key}
+
+
+def corpus_job(documents, restart=False):
+    key = ("corpus", tuple(d["doc_key"] for d in documents))
+    return start_job(key, summarize_corpus, documents, restart=restart)
+
+
+def plan_caption(plan):
+    if plan["strategy"] == "single":
+        how = "Whole document in one call"
+    elif plan["strategy"] == "chunked":
+        how = f"{plan['chunks']} parts, then one merge"
+    else:
+        how = f"{plan['chunks']} parts, merged in stages"
+    return (
+        f"⚙️ {how} · {plan['calls']} call{'s' if plan['calls'] != 1 else ''} · "
+        f"~{plan['input_tokens']:,} input tokens · est. ${plan['cost_usd']:.4f} · "
+        f"~{plan['seconds']:.0f}s"
+    )
+
+
+def summary_job(restart=False):
+    key = st.session_state.doc_key
+    return start_job(("summary", key), summarize_document, key, restart=restart)
+
+
+def bank_job(restart=False):
+    """
+    Fills the question bank for the current document (or document set),
+    tagging questions with its summary's topics.
+    """
+    key = st.session_state.doc_key
+    summary = st.session_state.corpus_data or st.session_state.summary_data or {}
+    return start_job(
+        ("bank", key), fill_bank, key, tuple(summary.get("topics", [])), restart=restart
+    )
 
-        # Keep only 10 questions max
-        final_quiz = {"quiz": all_quizzes[:10]}
-        return final_quiz
 
-    except Exception as e:
-        return {"error": str(e)}
+def ready_bank():
+    """
+    The finished question bank for the current document, or None.
+    """
+    key = st.session_state.doc_key
+    job = get_job(("bank", key))
+    if job and job.is_finished() and not job.failed():
+        return job.result["quiz"]
+    return question_bank.load_bank(key)
+
+
+def draw_quiz(pool):
+    questions = question_bank.sample_questions(
+        pool,
+        summarizer.QUIZ_QUESTIONS,
+        st.session_state.seen_questions,
+        st.session_state.quiz_topics,
+    )
+    st.session_state.seen_questions.update(q["question"] for q in questions)
+    return {"quiz": questions}
+
+
+def quiz_job(restart=False):
+    key = st.session_state.doc_key
+    topics = tuple(st.session_state.quiz_topics)
+    return start_job(("quiz", key, topics), quiz_document, key, topics, restart=restart)
 
 
 # -------------------- STREAMLIT UI --------------------
 
 # Initialize session state
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 if "page" not in st.session_state:
     st.session_state.page = "home"
-if "extracted_text" not in st.session_state:
-    st.session_state.extracted_text = ""
+if "doc_key" not in st.session_state:
+    st.session_state.doc_key = None
 if "summary_data" not in st.session_state:
     st.session_state.summary_data = None
 if "quiz_data" not in st.session_state:
     st.session_state.quiz_data = None
+if "uploads" not in st.session_state:
+    st.session_state.uploads = []
+if "corpus_data" not in st.session_state:
+    st.session_state.corpus_data = None
+if "quiz_topics" not in st.session_state:
+    st.session_state.quiz_topics = []
+if "answers" not in st.session_state:
+    st.session_state.answers = []
+if "seen_questions" not in st.session_state:
+    st.session_state.seen_questions = set()
 if "current_question" not in st.session_state:
     st.session_state.current_question = 0
 if "user_answers" not in st.session_state:
@@ -287,15 +311,72 @@ if "quiz_completed" not in st.session_state:
 
 
 def reset_app():
+    get_store().release(st.session_state.session_id)
     st.session_state.page = "home"
-    st.session_state.extracted_text = ""
+    st.session_state.doc_key = None
     st.session_state.summary_data = None
+    st.session_state.uploads = []
+    st.session_state.corpus_data = None
     st.session_state.quiz_data = None
+    st.session_state.quiz_topics = []
+    st.session_state.answers = []
+    st.session_state.seen_questions = set()
     st.session_state.current_question = 0
     st.session_state.user_answers = {}
     st.session_state.quiz_completed = False
 
 
+def start_quiz(topics=()):
+    """
+    Opens the quiz page. Focused quizzes are generated from the passages on
+    those topics; others are drawn from the question bank.
+    """
+    st.session_state.quiz_topics = list(topics)
+    # Asked for by the user, so a quiz or bank that failed before is retried
+    if topics:
+        quiz_job(restart=True)
+    else:
+        bank_job(restart=True)
+    st.session_state.quiz_data = None
+    st.session_state.current_question = 0
+    st.session_state.user_answers = {}
+    st.session_state.quiz_completed = False
+    st.session_state.page = "quiz"
+
+
+# Model calls started from this session are queued fairly against other sessions
+current_session.set(st.session_state.session_id)
+metrics.current_trace.set(st.session_state.session_id)
+
+
+def render_debug_panel():
+    with st.sidebar.expander("🔧 Debug", expanded=True):
+        spans = metrics.trace_spans(st.session_state.session_id)
+        if spans:
+            slowest = max(spans, key=lambda record: record["seconds"])
+            st.caption(
+                f"Slowest stage this session: {slowest['stage']} ({slowest['seconds']:.2f}s)"
+            )
+            st.dataframe(
+                [
+                    {k: v for k, v in record.items() if not isinstance(v, dict)}
+                    for record in spans[-50:]
+                ],
+                use_container_width=True,
+            )
+        st.markdown("**Stage latency (all sessions)**")
+        st.dataframe(
+            [dict(stage=stage, **summary) for stage, summary in metrics.stage_summary().items()],
+            use_container_width=True,
+        )
+        export = metrics.prometheus_text()
+        st.download_button("Download metrics", export, file_name="metrics.txt")
+
+
+# Hidden debug panel, opened with ?debug=1
+if st.query_params.get("debug") == "1":
+    render_debug_panel()
+
 # HOME PAGE
 if st.session_state.page == "home":
     st.markdown(
@@ -303,46 +384,99 @@ if st.session_state.page == "home":
         unsafe_allow_html=True,
     )
 
-    uploaded_file = st.file_uploader(
-        "Choose a file",
-        accept_multiple_files=False,
-        type=["pdf", "docx", "txt"],
-        help="Upload PDF, DOCX, TXT files for analysis",
+    formats = [extension.lstrip(".") for extension in supported_extensions()]
+    uploaded_files = st.file_uploader(
+        "Choose one or more files",
+        accept_multiple_files=True,
+        type=formats,
+        help=f"Upload {', '.join(formats).upper()} files for analysis",
     )
 
-    if uploaded_file:
+    # Several files are processed side by side and summarized together
+    if len(uploaded_files) > 1:
+        st.session_state.uploads = [upload_job(f.name, f.getvalue()) for f in uploaded_files]
+        st.session_state.corpus_data = None
+        st.session_state.page = "corpus"
+        st.rerun()
+
+    elif uploaded_files:
+        uploaded_file = uploaded_files[0]
         st.success(f"✅ File uploaded: {uploaded_file.name}")
 
-        with st.spinner("🔄 Processing your file..."):
-            if uploaded_file.name.endswith("pdf"):
-                st.session_state.extracted_text = extract_pdf(uploaded_file)
-            elif uploaded_file.name.endswith("docx"):
-                st.session_state.extracted_text = extract_doc(uploaded_file)
-            elif uploaded_file.name.endswith("txt"):
-                st.session_state.extracted_text = extract_text(uploaded_file)
-        if st.session_state.extracted_text:
-            with st.spinner("🧠 Generating intelligent summary..."):
-                st.session_state.summary_data = generate_summary(
-                    st.session_state.extracted_text
+        with st.spinner("🔄 Processing your file..."), metrics.span(
+            "extract", file_format=uploaded_file.name.rsplit(".", 1)[-1], bytes=uploaded_file.size
+        ):
+            extracted_text = extract_file(uploaded_file, uploaded_file.name, uploaded_file.type)
+        if extracted_text:
+            try:
+                st.session_state.doc_key = get_store().put(
+                    extracted_text, st.session_state.session_id
                 )
-                st.session_state.page = "summary"
-                st.rerun()
+            except ValueError as e:
+                st.error(f"❌ {e}")
+                st.stop()
+            st.session_state.summary_data = None
+            summary_job()
+            st.session_state.page = "summary"
+            st.rerun()
 
 # SUMMARY PAGE
 elif st.session_state.page == "summary":
-    if st.session_state.summary_data and "error" not in st.session_state.summary_data:
+    if st.session_state.summary_data is None:
+        # Reattaches to the running or finished job
+        job_state = summary_job().snapshot()
+        if job_state["finished"]:
+            st.session_state.summary_data = job_state["result"]
+            # Questions are ready by the time the summary has been read
+            if "error" not in job_state["result"]:
+                bank_job()
+            st.rerun()
+
+        st.markdown(
+            '<h2 class="main-header">🧠 Generating intelligent summary...</h2>',
+            unsafe_allow_html=True,
+        )
+        if "plan" in job_state["details"]:
+            st.caption(plan_caption(job_state["details"]["plan"]))
+        done, total = job_state["done"], job_state["total"]
+        if total and done < total:
+            st.progress(done / total, text=f"Summarized {done} of {total} sections")
+        elif total:
+            st.progress(1.0, text="Merging section summaries...")
+        else:
+            st.progress(0.0, text="Preparing document...")
+
+        # Once the merged summary starts streaming it replaces the section parts
+        parts = job_state["partials"]
+        merged = [part for part in parts if part.get("merged")]
+        for part in merged or parts:
+            cursor = " ▌" if part.get("streaming") else ""
+            st.markdown(
+                f'<div class="summary-box"><strong>{part.get("title", "")}</strong>'
+                f'<br>{part.get("summary", "")}{cursor}</div>',
+                unsafe_allow_html=True,
+            )
+
+        streaming = any(part.get("streaming") for part in parts)
+        time.sleep(STREAM_POLL_SECONDS if streaming else POLL_SECONDS)
+        st.rerun()
+
+    elif st.session_state.summary_data and "error" not in st.session_state.summary_data:
         # st.markdown(
         #     '<h1 class="main-header">📋 Document Summary</h1>', unsafe_allow_html=True
         # )
 
         doc_title = st.session_state.summary_data.get("title", "Untitled")
         doc_topics = st.session_state.summary_data.get("topics", [])
+        topic_sources = st.session_state.summary_data.get("topic_sources", {})
         doc_summary = st.session_state.summary_data.get("summary", "")
 
         # Display title with custom styling
         st.markdown(
             f'<h2 class="main-header"> {doc_title}</h2>', unsafe_allow_html=True
         )
+        if "plan" in st.session_state.summary_data:
+            st.caption(plan_caption(st.session_state.summary_data["plan"]))
 
         # Display topics in cards
         st.markdown(
@@ -352,12 +486,29 @@ elif st.session_state.page == "summary":
             cols = st.columns(2)
             for i, topic in enumerate(doc_topics):
                 col = cols[i % 2]
+                ranges = topic_sources.get(topic)
+                location = f"<br><small>📍 {section_label(ranges)}</small>" if ranges else ""
                 with col:
                     st.markdown(
-                        f'<div class="topic-card"><strong>{i+1}.</strong> {topic}</div>',
+                        f'<div class="topic-card"><strong>{i+1}.</strong> {topic}{location}</div>',
                         unsafe_allow_html=True,
                     )
 
+        # Jump from a topic to the parts of the document it came from
+        if topic_sources:
+            with st.expander("🔎 Where is each topic covered?"):
+                selected = st.selectbox(
+                    "Topic", [t for t in doc_topics if topic_sources.get(t)], index=None
+                )
+                if selected:
+                    for number, excerpt in section_excerpts(
+                        st.session_state.doc_key,
+                        topic_sources[selected],
+                        st.session_state.summary_data["plan"]["chunk_tokens"],
+                    ):
+                        st.markdown(f"**Section {number}**")
+                        st.caption(excerpt)
+
         # Display summary in a styled box
         st.markdown(
             '<h3 class="sub-header">📖 Comprehensive Summary</h3>',
@@ -367,8 +518,39 @@ elif st.session_state.page == "summary":
             f'<div class="summary-box">{doc_summary}</div>', unsafe_allow_html=True
         )
 
+        # Answers come from the few most relevant sections, not the whole document
+        st.markdown(
+            '<h3 class="sub-header">💬 Ask the Document</h3>', unsafe_allow_html=True
+        )
+        with st.form("ask_form", clear_on_submit=True):
+            question = st.text_input(
+                "Your question", placeholder="e.g. What are the main findings?"
+            )
+            asked = st.form_submit_button("Ask")
+        if asked and question.strip():
+            with st.spinner("🔎 Searching the document..."):
+                answer = ask_document(st.session_state.doc_key, question.strip())
+            st.session_state.answers.insert(0, dict(answer, question=question.strip()))
+        for item in st.session_state.answers:
+            st.markdown(f"**Q: {item['question']}**")
+            if "error" in item:
+                st.error(f"❌ Couldn't answer: {item['error']}")
+                continue
+            st.write(item["answer"])
+            if item["sources"]:
+                st.caption(
+                    f"📍 From {section_label(chunk_ranges(item['sources']), 'passage')}"
+                )
+
         # Action buttons with better spacing
         st.markdown("<br>", unsafe_allow_html=True)
+        focus = []
+        if doc_topics:
+            focus = st.multiselect(
+                "Focus the quiz on (optional)",
+                doc_topics,
+                help="Questions come only from the sections most relevant to these topics.",
+            )
         col1, col2, col3 = st.columns([1, 2, 1])
 
         with col1:
@@ -378,24 +560,166 @@ elif st.session_state.page == "summary":
 
         with col2:
             if st.button("🎯 Generate Quiz", use_container_width=True, type="primary"):
-                with st.spinner("🔄 Creating quiz questions..."):
-                    st.session_state.quiz_data = generate_quiz(
-                        st.session_state.extracted_text
+                start_quiz(focus)
+                st.rerun()
+    else:
+        error = (st.session_state.summary_data or {}).get("error", "no summary was returned")
+        st.error(f"❌ Failed to generate summary: {error}")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("🔄 Try Again", type="primary"):
+                st.session_state.summary_data = None
+                summary_job(restart=True)
+                st.rerun()
+        with col2:
+            if st.button("🏠 Back to Home"):
+                reset_app()
+                st.rerun()
+
+# CORPUS PAGE
+elif st.session_state.page == "corpus":
+    st.markdown(
+        '<h2 class="main-header">📚 Document Collection</h2>', unsafe_allow_html=True
+    )
+    snapshots = []
+    for upload in st.session_state.uploads:
+        job = get_job(upload["job"])
+        snapshots.append((upload["name"], job.snapshot() if job else None))
+    pending = [s for _, s in snapshots if s and not s["finished"]]
+    documents = [
+        s["result"]
+        for _, s in snapshots
+        if s and s["finished"] and "error" not in s["result"]
+    ]
+
+    corpus_data = st.session_state.corpus_data
+    streaming = False
+    if not pending and documents and corpus_data is None:
+        corpus_state = corpus_job(documents).snapshot()
+        if corpus_state["finished"]:
+            st.session_state.corpus_data = corpus_state["result"]
+            st.rerun()
+        st.progress(1.0, text="Combining document summaries...")
+        for part in corpus_state["partials"]:
+            streaming = True
+            st.markdown(
+                f'<div class="summary-box"><strong>{part.get("title", "")}</strong>'
+                f'<br>{part.get("summary", "")} ▌</div>',
+                unsafe_allow_html=True,
+            )
+    elif corpus_data and "error" not in corpus_data:
+        names = [d["name"] for d in documents]
+        st.markdown(
+            f'<h3 class="sub-header">🧩 {corpus_data.get("title", "Overview")}</h3>',
+            unsafe_allow_html=True,
+        )
+        st.markdown(
+            f'<div class="summary-box">{corpus_data.get("summary", "")}</div>',
+            unsafe_allow_html=True,
+        )
+        corpus_topics = corpus_data.get("topics", [])
+        if corpus_topics:
+            cols = st.columns(2)
+            for i, topic in enumerate(corpus_topics):
+                found_in = [
+                    names[d]
+                    for start, end in corpus_data["topic_sources"].get(topic, [])
+                    for d in range(start, end + 1)
+                ]
+                with cols[i % 2]:
+                    st.markdown(
+                        f'<div class="topic-card"><strong>{i+1}.</strong> {topic}'
+                        f'<br><small>📄 {", ".join(found_in)}</small></div>',
+                        unsafe_allow_html=True,
                     )
-                    st.session_state.current_question = 0
-                    st.session_state.user_answers = {}
-                    st.session_state.quiz_completed = False
-                    st.session_state.page = "quiz"
-                    st.rerun()
+    elif corpus_data:
+        st.error(f"❌ Failed to combine the summaries: {corpus_data['error']}")
+        if st.button("🔄 Try Again", type="primary"):
+            st.session_state.corpus_data = None
+            corpus_job(documents, restart=True)
+            st.rerun()
+    elif not pending:
+        st.error("❌ None of the documents could be summarized.")
     else:
-        st.error("❌ Failed to generate summary. Please try again.")
-        if st.button("🏠 Back to Home", type="primary"):
+        done = len(snapshots) - len(pending)
+        st.progress(
+            done / len(snapshots), text=f"Summarized {done} of {len(snapshots)} documents"
+        )
+
+    # Each document is shown as soon as its own summary is ready
+    st.markdown(
+        '<h3 class="sub-header">📄 Documents</h3>', unsafe_allow_html=True
+    )
+    for name, snapshot in snapshots:
+        if snapshot is None:
+            st.warning(f"⚠️ {name}: processing expired, please upload it again")
+        elif not snapshot["finished"]:
+            done, total = snapshot["done"], snapshot["total"]
+            st.progress(
+                done / total if total else 0.0,
+                text=f"{name}: summarized {done} of {total} sections"
+                if total
+                else f"{name}: extracting text...",
+            )
+        elif "error" in snapshot["result"]:
+            st.warning(f"⚠️ {name}: {snapshot['result']['error']}")
+        else:
+            result = snapshot["result"]
+            with st.expander(f"✅ {name} — {result.get('title', 'Untitled')}"):
+                st.caption(" · ".join(result.get("topics", [])))
+                st.write(result.get("summary", ""))
+
+    if pending or (documents and st.session_state.corpus_data is None):
+        time.sleep(STREAM_POLL_SECONDS if streaming else POLL_SECONDS)
+        st.rerun()
+
+    st.markdown("<br>", unsafe_allow_html=True)
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("🏠 Home", use_container_width=True, type="secondary"):
             reset_app()
             st.rerun()
+    with col2:
+        ready = corpus_data and "error" not in corpus_data
+        if ready and st.button(
+            "🎯 Generate Combined Quiz", use_container_width=True, type="primary"
+        ):
+            st.session_state.doc_key = get_store().put(
+                corpus_text(documents), st.session_state.session_id
+            )
+            start_quiz()
+            st.rerun()
 
 # QUIZ PAGE
 elif st.session_state.page == "quiz":
-    if st.session_state.quiz_data and "error" not in st.session_state.quiz_data:
+    if st.session_state.quiz_data is None:
+        job = quiz_job() if st.session_state.quiz_topics else bank_job()
+        job_state = job.snapshot()
+        # The quiz starts as soon as enough questions exist, even mid-job
+        collected = [q for batch in job_state["partials"] for q in batch]
+        wanted = summarizer.QUIZ_QUESTIONS
+        if job_state["finished"] and "error" in job_state["result"]:
+            st.session_state.quiz_data = job_state["result"]
+            st.rerun()
+        if job_state["finished"] or len(collected) >= wanted:
+            pool = job_state["result"]["quiz"] if job_state["finished"] else collected
+            st.session_state.quiz_data = draw_quiz(pool)
+            st.rerun()
+
+        st.markdown(
+            '<h1 class="main-header">🔄 Creating quiz questions...</h1>',
+            unsafe_allow_html=True,
+        )
+        done = min(len(collected), wanted)
+        st.progress(
+            done / wanted,
+            text=f"{done} of {wanted} questions ready" if job_state["total"] else "Planning quiz...",
+        )
+
+        time.sleep(POLL_SECONDS)
+        st.rerun()
+
+    elif st.session_state.quiz_data and "error" not in st.session_state.quiz_data:
         quizzes = st.session_state.quiz_data.get("quiz", [])
 
         if quizzes and st.session_state.current_question < len(quizzes):
@@ -423,6 +747,8 @@ elif st.session_state.page == "quiz":
                 f'<div class="quiz-question"><h3>{current_q["question"]}</h3></div>',
                 unsafe_allow_html=True,
             )
+            if current_q.get("topic"):
+                st.caption(f"🏷️ {current_q['topic']} · {current_q.get('difficulty', 'medium')}")
 
             # Options without auto-selection
             options = current_q.get("options", [])
@@ -503,10 +829,17 @@ elif st.session_state.page == "quiz":
                 reset_app()
                 st.rerun()
     else:
-        st.error("❌ Failed to generate quiz. Please try again.")
-        if st.button("🏠 Back to Home"):
-            reset_app()
-            st.rerun()
+        error = (st.session_state.quiz_data or {}).get("error", "no questions were returned")
+        st.error(f"❌ Failed to generate quiz: {error}")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("🔄 Try Again", type="primary"):
+                start_quiz(st.session_state.quiz_topics)
+                st.rerun()
+        with col2:
+            if st.button("🏠 Back to Home"):
+                reset_app()
+                st.rerun()
 
 # RESULTS PAGE
 elif st.session_state.page == "results":
@@ -587,6 +920,10 @@ elif st.session_state.page == "results":
 
         with col2:
             if st.button("🔄 Retry Quiz", use_container_width=True, type="primary"):
+                # Fresh questions from the bank; without one the quiz is replayed
+                bank = ready_bank()
+                if bank:
+                    st.session_state.quiz_data = draw_quiz(bank)
                 st.session_state.current_question = 0
                 st.session_state.user_answers = {}
                 st.session_state.quiz_completed = False
@@ -597,7 +934,7 @@ elif st.session_state.page == "results":
             if st.button(
                 "📖 Back to Summary", use_container_width=True, type="secondary"
             ):
-                st.session_state.page = "summary"
+                st.session_state.page = "corpus" if st.session_state.uploads else "summary"
                 st.rerun()
 
 else:
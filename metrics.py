@@ -0,0 +1,153 @@
+"""
+Lightweight tracing for the processing pipeline.
+
+Wrap a stage in span(stage, **attrs) to time it. Numeric attributes set on
+the span (tokens, characters, retries, ...) are summed per stage, the last
+STAGE_WINDOW durations of each stage are kept for percentiles, and every
+finished span is logged as one JSON line on the "metrics" logger. Spans are
+also grouped by the current trace (the Streamlit session, for the app) so a
+single slow request can be inspected on its own.
+"""
+
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+import contextvars
+import json
+import logging
+import threading
+import time
+
+STAGE_WINDOW = 1000
+MAX_TRACES = 200
+MAX_TRACE_SPANS = 500
+
+logger = logging.getLogger("metrics")
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+current_span = contextvars.ContextVar("current_span", default=None)
+
+lock = threading.Lock()
+durations = defaultdict(lambda: deque(maxlen=STAGE_WINDOW))
+totals = defaultdict(lambda: {"count": 0, "seconds": 0.0, "errors": 0})
+counters = defaultdict(float)
+traces = OrderedDict()
+collectors = []
+
+
+@contextmanager
+def span(stage, **attrs):
+    record = dict(attrs, stage=stage)
+    token = current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        current_span.reset(token)
+        record["seconds"] = time.perf_counter() - started
+        observe(record)
+
+
+def annotate(**values):
+    """
+    Adds values to the numeric attributes of the innermost open span.
+    """
+    record = current_span.get()
+    if record is not None:
+        for key, value in values.items():
+            record[key] = record.get(key, 0) + value
+
+
+def observe(record):
+    stage = record["stage"]
+    trace = current_trace.get()
+    with lock:
+        durations[stage].append(record["seconds"])
+        totals[stage]["count"] += 1
+        totals[stage]["seconds"] += record["seconds"]
+        if "error" in record:
+            totals[stage]["errors"] += 1
+        for key, value in record.items():
+            if key != "seconds" and isinstance(value, (int, float)) and not isinstance(value, bool):
+                counters[(stage, key)] += value
+        if trace is not None:
+            spans = traces.pop(trace, None) or deque(maxlen=MAX_TRACE_SPANS)
+            spans.append(record)
+            traces[trace] = spans
+            while len(traces) > MAX_TRACES:
+                traces.popitem(last=False)
+    logger.info(json.dumps(dict(record, event="span", trace=trace), default=str))
+
+
+def register_collector(fn):
+    """
+    fn() returns a dict of name -> number, exported as gauges.
+    """
+    collectors.append(fn)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def stage_summary():
+    with lock:
+        window = {stage: list(values) for stage, values in durations.items()}
+        stage_totals = {stage: dict(t) for stage, t in totals.items()}
+    return {
+        stage: dict(
+            stage_totals[stage],
+            p50=percentile(values, 0.5),
+            p95=percentile(values, 0.95),
+            max=max(values),
+        )
+        for stage, values in window.items()
+    }
+
+
+def trace_spans(trace):
+    with lock:
+        return list(traces.get(trace, []))
+
+
+def collected():
+    values = {}
+    for fn in collectors:
+        try:
+            values.update(fn())
+        except Exception as e:
+            logger.warning("metrics collector failed: %s", e)
+    return values
+
+
+def prometheus_text():
+    lines = [
+        "# HELP stage_duration_seconds Time spent per pipeline stage",
+        "# TYPE stage_duration_seconds summary",
+    ]
+    for stage, summary in sorted(stage_summary().items()):
+        for quantile in ("0.5", "0.95"):
+            value = summary["p50"] if quantile == "0.5" else summary["p95"]
+            lines.append(
+                f'stage_duration_seconds{{stage="{stage}",quantile="{quantile}"}} {value:.6f}'
+            )
+        lines.append(f'stage_duration_seconds_sum{{stage="{stage}"}} {summary["seconds"]:.6f}')
+        lines.append(f'stage_duration_seconds_count{{stage="{stage}"}} {summary["count"]}')
+        lines.append(f'stage_errors_total{{stage="{stage}"}} {summary["errors"]}')
+
+    with lock:
+        stage_counters = sorted(counters.items())
+    lines.append("# HELP stage_attribute_total Sum of a numeric span attribute per stage")
+    lines.append("# TYPE stage_attribute_total counter")
+    for (stage, key), value in stage_counters:
+        lines.append(f'stage_attribute_total{{stage="{stage}",attribute="{key}"}} {value:g}')
+
+    for name, value in sorted(collected().items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value:g}")
+    return "\n".join(lines) + "\n"
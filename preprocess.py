@@ -0,0 +1,89 @@
+"""
+Token reduction between the extractors and the chunker.
+
+Extracted text often carries page furniture (running headers, footers, page
+numbers), words hyphenated across line breaks and layout whitespace. None of
+it helps the model, and every model call pays for it.
+"""
+
+from collections import Counter
+import re
+
+from tokens import estimate_tokens
+
+PAGE_BREAK = "\f"
+# Lines this close to the top or bottom of a page may be headers or footers
+EDGE_LINES = 3
+# A header or footer line recurs on at least this share of pages (and on at least two)
+REPEAT_SHARE = 0.5
+
+DIGITS = re.compile(r"\d+")
+PAGE_NUMBER = re.compile(r"^\W*(?:page\s*)?\d+(?:\s*(?:of|/)\s*\d+)?\W*$", re.I)
+# One pass over the text: a word hyphenated across a line break is rejoined,
+# a blank line becomes a paragraph break and any other whitespace one space
+WHITESPACE = re.compile(
+    r"(?P<hyphen>(?<=[^\W\d_])-[^\S\n]*\n\s*(?=[a-zà-ÿ]))"
+    r"|(?P<paragraph>\s*\n[^\S\n]*\n\s*)"
+    r"|\s+"
+)
+
+
+def line_shape(line):
+    # Page numbers inside headers ("Page 3 of 12") don't make lines different
+    return DIGITS.sub("#", line.strip().lower())
+
+
+def edge_indexes(lines):
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return set(filled[:EDGE_LINES] + filled[-EDGE_LINES:])
+
+
+def strip_repeated_lines(pages):
+    """
+    Drops lines near the top or bottom of a page that recur on many pages,
+    and bare page numbers there.
+    """
+    lines = [page.split("\n") for page in pages]
+    edges = [edge_indexes(page_lines) for page_lines in lines]
+    shapes = Counter()
+    for page_lines, edge in zip(lines, edges):
+        shapes.update({line_shape(page_lines[i]) for i in edge})
+    needed = max(2, REPEAT_SHARE * len(pages))
+    repeated = {shape for shape, count in shapes.items() if count >= needed}
+
+    kept = []
+    for page_lines, edge in zip(lines, edges):
+        kept.append(
+            "\n".join(
+                line
+                for i, line in enumerate(page_lines)
+                if i not in edge
+                or not (line_shape(line) in repeated or PAGE_NUMBER.match(line))
+            )
+        )
+    return kept
+
+
+def normalize_whitespace(text, dehyphenate=True):
+    def replace(match):
+        if match.group("hyphen"):
+            return "" if dehyphenate else "- "
+        if match.group("paragraph"):
+            return "\n\n"
+        return " "
+
+    return WHITESPACE.sub(replace, text).strip()
+
+
+def preprocess(text, strip_repeated=True, dehyphenate=True):
+    """
+    Returns (clean_text, tokens_saved). Pages are separated by PAGE_BREAK in
+    the extracted text; repeated lines are only looked for when there are
+    several pages.
+    """
+    pages = text.split(PAGE_BREAK)
+    if strip_repeated and len(pages) > 1:
+        pages = strip_repeated_lines(pages)
+    # Sentences and hyphenated words carry on across page breaks
+    clean = normalize_whitespace("\n".join(pages), dehyphenate)
+    return clean, max(0, estimate_tokens(text) - estimate_tokens(clean))
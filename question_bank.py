@@ -0,0 +1,127 @@
+"""
+Quiz questions generated ahead of time, once per document.
+
+A bank of QUESTION_BANK_SIZE questions is filled in the background after a
+summary is ready, deduplicated, tagged with one of the summary's topics and a
+difficulty, and saved next to the document in the document store (so it is
+swept with it). Quizzes are drawn from the bank, so starting or retrying a
+quiz needs no model calls.
+"""
+
+from collections import OrderedDict
+from dotenv import load_dotenv
+import json
+import os
+import random
+import threading
+
+from cache import content_key
+from doc_store import DOC_STORE_DIR
+from topics import TopicIndex, topic_tokens
+import summarizer
+
+load_dotenv()
+
+QUESTION_BANK_SIZE = int(os.getenv("QUESTION_BANK_SIZE", "30"))
+BANK_VERSION = "1"
+DIFFICULTIES = ("easy", "medium", "hard")
+
+
+def bank_path(doc_key, size=QUESTION_BANK_SIZE):
+    # Named after the document so the document store sweeps it with the text
+    suffix = content_key(BANK_VERSION, str(size), summarizer.QUIZ_SYSTEM_MESSAGE)[:16]
+    return os.path.join(DOC_STORE_DIR, f"{doc_key}.{suffix}.bank.json")
+
+
+def load_bank(doc_key, size=QUESTION_BANK_SIZE):
+    try:
+        with open(bank_path(doc_key, size), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_bank(doc_key, questions, size=QUESTION_BANK_SIZE):
+    path = bank_path(doc_key, size)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(questions, f)
+    os.replace(temp_path, path)
+
+
+def tag_questions(questions, topics=()):
+    """
+    Maps each question's topic onto the closest summary topic, where there
+    is one, and its difficulty onto DIFFICULTIES.
+    """
+    index = TopicIndex()
+    for topic in topics:
+        index.add(topic, [])
+    for question in questions:
+        topic = str(question.get("topic") or "").strip()
+        position = index.find(topic) if topic else None
+        question["topic"] = index.topics[position] if position is not None else topic or "General"
+        difficulty = str(question.get("difficulty", "")).lower()
+        question["difficulty"] = difficulty if difficulty in DIFFICULTIES else "medium"
+    return questions
+
+
+def dedupe_questions(questions):
+    """
+    Drops questions that only differ from an earlier one in case, word
+    order, plurals or stop words.
+    """
+    unique = OrderedDict()
+    for question in questions:
+        key = " ".join(sorted(set(topic_tokens(question["question"]))))
+        unique.setdefault(key, question)
+    return list(unique.values())
+
+
+def build_bank(doc_key, text, topics=(), size=QUESTION_BANK_SIZE, progress=None):
+    """
+    Returns {"quiz": questions} for the document, from disk when it has been
+    built before. progress(done, total, batch, questions) reports each batch
+    of questions as it is generated.
+    """
+    bank = load_bank(doc_key, size)
+    if bank is not None:
+        return {"quiz": bank}
+    result = summarizer.generate_quiz(text, questions=size, progress=progress)
+    if "error" in result:
+        return result
+    bank = dedupe_questions(tag_questions(result["quiz"], topics))
+    save_bank(doc_key, bank, size)
+    return {"quiz": bank}
+
+
+def sample_questions(bank, count, seen=(), topics=(), rng=random):
+    """
+    Draws count questions: unseen ones before seen ones and, with topics,
+    questions on those topics first. Within that order picks take turns
+    across topics, and the quiz runs from easy to hard.
+    """
+    shuffled = rng.sample(bank, len(bank))
+    tiers = [[], [], [], []]
+    for question in shuffled:
+        tier = 2 * (question["question"] in seen)
+        tier += bool(topics) and question.get("topic") not in topics
+        tiers[tier].append(question)
+
+    picked = []
+    for tier in tiers:
+        by_topic = OrderedDict()
+        for question in tier:
+            by_topic.setdefault(question.get("topic"), []).append(question)
+        while by_topic and len(picked) < count:
+            for topic in list(by_topic):
+                picked.append(by_topic[topic].pop(0))
+                if not by_topic[topic]:
+                    del by_topic[topic]
+                if len(picked) == count:
+                    break
+    return sorted(
+        picked,
+        key=lambda q: DIFFICULTIES.index(q["difficulty"]) if q.get("difficulty") in DIFFICULTIES else 1,
+    )
@@ -0,0 +1,200 @@
+"""
+BM25 retrieval over the chunks of a document.
+
+The index is built once per document and chunking settings, saved next to
+the document in the document store (so it is swept with it), and scored
+with NumPy: a query touches only the postings of its own terms, so lookups
+cost the same whatever the document length.
+"""
+
+from collections import Counter, OrderedDict
+import numpy as np
+import os
+import re
+import threading
+
+from cache import content_key
+from doc_store import DOC_STORE_DIR
+from metrics import register_collector, span
+
+# Parsed indexes kept in memory across all sessions
+RETRIEVAL_MEMORY_INDEXES = 16
+INDEX_VERSION = "1"
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TERM_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TERM_PATTERN.findall(text.lower())
+
+
+def pack_strings(strings, separator=""):
+    """
+    Joins strings into one UTF-8 byte array plus start offsets, which NumPy
+    can save and load without pickling.
+    """
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(data, offsets):
+    raw = data.tobytes()
+    return [
+        raw[offsets[i] : offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)
+    ]
+
+
+class BM25Index:
+    """
+    Postings are stored term-major (CSR): the chunks containing term t are
+    doc_ids[indptr[t]:indptr[t + 1]], with their term counts in frequencies.
+    """
+
+    def __init__(self, chunks, terms, indptr, doc_ids, frequencies, lengths):
+        self.chunks = chunks
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.frequencies = frequencies
+        self.lengths = lengths
+
+        count = max(len(chunks), 1)
+        document_frequency = np.diff(indptr).astype(np.float64)
+        self.idf = np.log1p((count - document_frequency + 0.5) / (document_frequency + 0.5))
+        average = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+        self.norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average)
+
+    @classmethod
+    def build(cls, chunks):
+        terms = {}
+        term_ids, doc_ids, frequencies = [], [], []
+        lengths = np.zeros(len(chunks), dtype=np.float64)
+        for doc, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            lengths[doc] = len(tokens)
+            for term, frequency in Counter(tokens).items():
+                term_ids.append(terms.setdefault(term, len(terms)))
+                doc_ids.append(doc)
+                frequencies.append(frequency)
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=indptr[1:])
+        return cls(
+            list(chunks),
+            list(terms),
+            indptr,
+            np.array(doc_ids, dtype=np.int64)[order],
+            np.array(frequencies, dtype=np.float64)[order],
+            lengths,
+        )
+
+    def save(self, path):
+        text, text_offsets = pack_strings(self.chunks)
+        terms, term_offsets = pack_strings(self.terms)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(
+                f,
+                text=text,
+                text_offsets=text_offsets,
+                terms=terms,
+                term_offsets=term_offsets,
+                indptr=self.indptr,
+                doc_ids=self.doc_ids,
+                frequencies=self.frequencies,
+                lengths=self.lengths,
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                unpack_strings(data["text"], data["text_offsets"]),
+                unpack_strings(data["terms"], data["term_offsets"]),
+                data["indptr"],
+                data["doc_ids"],
+                data["frequencies"],
+                data["lengths"],
+            )
+
+    def scores(self, query):
+        ids = [self.terms[t] for t in set(tokenize(query)) if t in self.terms]
+        if not ids:
+            return np.zeros(len(self.chunks))
+        slices = [np.arange(self.indptr[t], self.indptr[t + 1]) for t in ids]
+        postings = np.concatenate(slices)
+        weights = np.repeat(self.idf[ids], [len(s) for s in slices])
+        docs = self.doc_ids[postings]
+        tf = self.frequencies[postings]
+        contributions = weights * tf * (BM25_K1 + 1) / (tf + self.norm[docs])
+        return np.bincount(docs, weights=contributions, minlength=len(self.chunks))
+
+    def search(self, query, k):
+        """
+        Returns up to k (chunk_index, score) pairs, best first, skipping
+        chunks that share no term with the query.
+        """
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+
+indexes = OrderedDict()
+indexes_lock = threading.Lock()
+
+
+def index_path(doc_key, chunk_settings):
+    # Named after the document so the document store sweeps it with the text
+    suffix = content_key(INDEX_VERSION, *map(str, chunk_settings))[:16]
+    return os.path.join(DOC_STORE_DIR, f"{doc_key}.{suffix}.bm25.npz")
+
+
+def get_index(doc_key, chunk_settings, make_chunks):
+    """
+    Returns the index for a document, loading it from disk or building it
+    from make_chunks() on first use. chunk_settings identify how the chunks
+    were made, so a change in chunking never reuses a stale index.
+    """
+    path = index_path(doc_key, chunk_settings)
+    with indexes_lock:
+        if path in indexes:
+            indexes.move_to_end(path)
+            return indexes[path]
+
+    with span("index") as record:
+        try:
+            index = BM25Index.load(path)
+            os.utime(path)
+            record["cache_hits"] = 1
+        except (FileNotFoundError, ValueError, KeyError, OSError):
+            index = BM25Index.build(make_chunks())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            index.save(path)
+        record["chunks"] = len(index.chunks)
+        record["terms"] = len(index.terms)
+
+    with indexes_lock:
+        indexes[path] = index
+        while len(indexes) > RETRIEVAL_MEMORY_INDEXES:
+            indexes.popitem(last=False)
+    return index
+
+
+def retrieval_metrics():
+    with indexes_lock:
+        return {"retrieval_indexes_loaded": len(indexes)}
+
+
+register_collector(retrieval_metrics)
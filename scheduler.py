@@ -0,0 +1,165 @@
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+from metrics import annotate, register_collector
+import contextvars
+import os
+import random
+import threading
+import time
+
+load_dotenv()
+
+# Limits shared by every session in the process
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "16"))
+RATE_LIMIT_RPM = int(os.getenv("RATE_LIMIT_RPM", "0"))  # 0 means no limit
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.getenv("BACKOFF_MAX", "30.0"))
+
+THROTTLE_CODES = {429}
+RETRY_CODES = {429, 500, 502, 503, 504}
+
+# Which session the calls made from this context belong to
+current_session = contextvars.ContextVar("current_session", default="default")
+
+
+def error_code(error):
+    code = getattr(error, "code", None)
+    if callable(code):  # grpc errors expose code() instead
+        return None
+    return code if isinstance(code, int) else getattr(error, "status_code", None)
+
+
+class Scheduler:
+    """
+    Gates every model call in the process.
+
+    Waiting calls are queued per session and granted round-robin across
+    sessions, so one large document cannot starve the others. Calls are
+    spaced to stay under rate_per_minute, and the number in flight is cut in
+    half whenever the API throttles us, then grown back by one after each
+    window of successful calls. Throttled and transient failures are retried
+    with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        max_concurrency=SCHEDULER_MAX_CONCURRENCY,
+        rate_per_minute=RATE_LIMIT_RPM,
+        max_retries=MAX_RETRIES,
+        backoff_base=BACKOFF_BASE,
+        backoff_max=BACKOFF_MAX,
+    ):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.interval = 60.0 / rate_per_minute if rate_per_minute else 0.0
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cond = threading.Condition()
+        self.queues = OrderedDict()
+        self.active = 0
+        self.next_start = 0.0
+        self.successes = 0
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0}
+
+    def is_next(self, ticket):
+        return next(iter(self.queues.values()))[0] is ticket
+
+    def acquire(self, session):
+        ticket = object()
+        with self.cond:
+            self.queues.setdefault(session, deque()).append(ticket)
+            while not self.is_next(ticket) or self.active >= self.limit:
+                self.cond.wait()
+            # Serve the head of this session, then send the session to the back
+            queue = self.queues.pop(session)
+            queue.popleft()
+            if queue:
+                self.queues[session] = queue
+            self.active += 1
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+            self.cond.notify_all()
+        if start > now:
+            time.sleep(start - now)
+
+    def release(self, throttled=False, succeeded=True):
+        with self.cond:
+            self.active -= 1
+            self.stats["calls"] += 1
+            if throttled:
+                self.stats["throttled"] += 1
+                self.limit = max(1, self.limit // 2)
+                self.successes = 0
+            elif succeeded:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self.successes = 0
+            self.cond.notify_all()
+
+    def backoff(self, attempt):
+        cap = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def call(self, fn, session=None):
+        """
+        Runs fn() once it is this session's turn, retrying throttled and
+        transient failures. The last error is raised once retries run out.
+        """
+        session = session or current_session.get()
+        attempt = 0
+        while True:
+            queued = time.perf_counter()
+            self.acquire(session)
+            annotate(queue_seconds=time.perf_counter() - queued)
+            try:
+                result = fn()
+            except Exception as e:
+                code = error_code(e)
+                self.release(throttled=code in THROTTLE_CODES, succeeded=False)
+                if code not in RETRY_CODES or attempt >= self.max_retries:
+                    with self.cond:
+                        self.stats["failures"] += 1
+                    raise
+                with self.cond:
+                    self.stats["retries"] += 1
+                annotate(retries=1, throttled=int(code in THROTTLE_CODES))
+                time.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            self.release()
+            return result
+
+    def snapshot(self):
+        with self.cond:
+            return dict(
+                self.stats,
+                limit=self.limit,
+                active=self.active,
+                waiting=sum(len(q) for q in self.queues.values()),
+                sessions=len(self.queues),
+            )
+
+
+scheduler = None
+scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global scheduler
+    with scheduler_lock:
+        if scheduler is None:
+            scheduler = Scheduler()
+    return scheduler
+
+
+def scheduler_metrics():
+    if scheduler is None:
+        return {}
+    return {f"scheduler_{name}": value for name, value in scheduler.snapshot().items()}
+
+
+register_collector(scheduler_metrics)
@@ -0,0 +1,977 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from backends import get_client
+from cache import DiskCache, content_key
+from dedup import find_duplicates
+from metrics import register_collector, span
+from scheduler import get_scheduler
+from tokens import estimate_tokens
+from topics import TopicIndex
+from dotenv import load_dotenv
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+
+load_dotenv()
+
+SUMMARY_SYSTEM_MESSAGE = """
+You are an intelligent AI assistant. Your task is to process user-provided content and create a comprehensive summary.
+
+Generate a summary in the following JSON format:
+{
+  "title": "Main content or subject the file focuses on",
+  "topics": ["List of all key topics covered at a high level. Only include main topics, not subtypes or granular details. For example, for memory consistency models, just include 'Memory Consistency Models', not strong, weak, or other types."],
+  "summary": "A clear and detailed summary covering important information, insights, or events. Make this comprehensive and well-structured."
+}
+
+The response must be strictly valid JSON (no extra text, no markdown). Only provide high-level topics in the topics array.
+"""
+
+QUIZ_SYSTEM_MESSAGE = """
+You are an intelligent quiz generator. Based on the provided content, generate exactly {count} multiple-choice questions.
+
+Generate quizzes in the following JSON format:
+{{
+  "quiz": [
+    {{
+      "question": "Clear MCQ question based on the content",
+      "options": ["Option A", "Option B", "Option C", "Option D"],
+      "correct_answer": "Correct option (must match exactly one of the options)",
+      "explanation": "Brief explanation why this answer is correct",
+      "topic": "The key topic this question tests, in a few words",
+      "difficulty": "easy, medium or hard"
+    }}
+  ]
+}}
+
+Requirements:
+- Generate exactly {count} questions
+- Each question must have exactly 4 options
+- Questions should cover different aspects of the content
+- Mix easy, medium and hard questions
+- The response must be strictly valid JSON (no extra text, no markdown).
+"""
+
+REDUCE_SYSTEM_MESSAGE = """
+You are an intelligent AI assistant. You are given several partial summaries of consecutive parts of one document, in order.
+
+Merge them into a single summary in the following JSON format:
+{{
+  "title": "Main content or subject the document focuses on",
+  "summary": "One coherent, well-structured summary of all the parts"
+}}
+
+Requirements:
+- The summary must be at most {target_words} words
+- Keep the most important information from every part and drop repetition
+- The response must be strictly valid JSON (no extra text, no markdown).
+"""
+
+PACKED_SYSTEM_MESSAGE = """
+{system_message}
+
+The content below is made of {count} separate sections, each starting with a line like "### Section 1".
+Answer for every section on its own, exactly as described above.
+
+Respond with {{"results": [...]}} where results holds exactly {count} answers, one per section, in section order.
+The response must be strictly valid JSON (no extra text, no markdown).
+"""
+
+ANSWER_SYSTEM_MESSAGE = """
+You are an intelligent AI assistant. Answer the user's question using only the numbered excerpts of a document below.
+
+Respond in the following JSON format:
+{
+  "answer": "A clear, direct answer to the question, based only on the excerpts",
+  "excerpts": [1]
+}
+
+Requirements:
+- "excerpts" lists the numbers of the excerpts the answer relies on
+- If the excerpts don't contain the answer, say so in "answer" and return an empty "excerpts" list
+- The response must be strictly valid JSON (no extra text, no markdown).
+"""
+
+model_name = "gemini-2.0-flash"
+
+# Limits and rough speed and price per model, for planning calls. Prices are
+# USD per million tokens; speeds are typical, not guaranteed.
+MODEL_PROFILES = {
+    "gemini-2.0-flash": {
+        "input_tokens": 1_048_576,
+        "output_tokens": 8_192,
+        "input_price": 0.10,
+        "output_price": 0.40,
+        "round_trip_seconds": 0.8,
+        "input_tokens_per_second": 20_000,
+        "output_tokens_per_second": 150,
+    },
+}
+DEFAULT_MODEL_PROFILE = {
+    "input_tokens": 32_768,
+    "output_tokens": 8_192,
+    "input_price": 0.0,
+    "output_price": 0.0,
+    "round_trip_seconds": 1.0,
+    "input_tokens_per_second": 5_000,
+    "output_tokens_per_second": 50,
+}
+
+# Upper bound on in-flight model calls per document
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "8"))
+
+# Largest document part sent in one call. Parts are cached, deduplicated and
+# summarized in parallel, so long documents are still split well below the
+# context window; 0 uses as much of the window as the prompt leaves free
+MAX_CALL_TOKENS = int(os.getenv("MAX_CALL_TOKENS", "32000"))
+# Share of the model's context window a call is planned to fill, leaving
+# room for token counts that are only estimates
+CONTEXT_SHARE = float(os.getenv("CONTEXT_SHARE", "0.8"))
+# Token budget per passage searched for questions, and tokens repeated
+# between neighbouring chunks
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "4000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "0"))
+# Passages passed to the model per question or quiz topic
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+# Expected length of one chunk summary, for planning
+SUMMARY_REPLY_TOKENS = 1000
+
+# Questions per quiz, and how many to ask a single call for
+QUIZ_QUESTIONS = int(os.getenv("QUIZ_QUESTIONS", "10"))
+QUIZ_QUESTIONS_PER_CALL = int(os.getenv("QUIZ_QUESTIONS_PER_CALL", "3"))
+
+# Disk cache of parsed model responses; set LLM_CACHE_PATH= to disable it
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite3")
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "512"))
+LLM_CACHE_MAX_AGE_DAYS = int(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30"))
+
+# Stream replies that report partial results, so the summary shows up as it is written
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"
+
+# Up to this many estimated tokens of chunks are packed into one request; 0 disables packing
+PACK_TOKENS = int(os.getenv("PACK_TOKENS", "0"))
+
+# Number of summaries merged per call, and the length each merge aims for
+REDUCE_FAN_IN = int(os.getenv("REDUCE_FAN_IN", "4"))
+SUMMARY_TARGET_WORDS = int(os.getenv("SUMMARY_TARGET_WORDS", "400"))
+
+
+# -------------------- HELPER: CHUNKING --------------------
+# A sentence ends at terminal punctuation, a blank line or the end of text.
+# Run-on text is cut at the last whitespace within 8000 characters.
+SENTENCE_PATTERN = re.compile(
+    r"(\S.{0,8000}?(?:[.!?][\"')\]]*(?=\s|$)|(?=\n[^\S\n]*\n)|$)"
+    r"|\S.{0,8000}(?=\s)|\S.{0,8000})(\s*)",
+    re.S,
+)
+
+
+def split_sentence(words, ends_paragraph, max_tokens, estimate_tokens):
+    sentence = " ".join(words)
+    # Counted with the separator join_sentences puts after it, so the counts
+    # of a chunk's sentences add up to at least the chunk's own estimate
+    tokens = estimate_tokens(sentence + ("\n\n" if ends_paragraph else " "))
+    if tokens <= max_tokens or len(sentence) == 1:
+        yield sentence, tokens, ends_paragraph
+        return
+    # Cut into the fewest even pieces that may fit: by words or, for text
+    # without spaces (e.g. Chinese or Japanese), by characters
+    pieces = words if len(words) > 1 else sentence
+    count = min(len(pieces), -(-tokens // max_tokens))
+    for n in range(count):
+        piece = pieces[len(pieces) * n // count : len(pieces) * (n + 1) // count]
+        yield from split_sentence(
+            piece if len(words) > 1 else [piece],
+            ends_paragraph and n == count - 1,
+            max_tokens,
+            estimate_tokens,
+        )
+
+
+def iter_sentences(text, max_tokens, estimate_tokens=estimate_tokens):
+    """
+    Yields (sentence, tokens, ends_paragraph) in a single pass over text,
+    where tokens includes the break that follows the sentence in a chunk.
+    Only the current sentence is buffered, and sentences over max_tokens are
+    cut at word boundaries.
+    """
+    for match in SENTENCE_PATTERN.finditer(text):
+        sentence, space = match.groups()
+        ends_paragraph = space.count("\n") > 1
+        yield from split_sentence(
+            sentence.split(), ends_paragraph, max_tokens, estimate_tokens
+        )
+
+
+def join_sentences(sentences):
+    parts = []
+    for sentence, _, ends_paragraph in sentences:
+        parts.append(sentence)
+        parts.append("\n\n" if ends_paragraph else " ")
+    return "".join(parts[:-1])
+
+
+def overlap_tail(sentences, overlap):
+    tail = []
+    tokens = 0
+    for sentence in reversed(sentences):
+        if tokens + sentence[1] > overlap:
+            break
+        tail.insert(0, sentence)
+        tokens += sentence[1]
+    return tail, tokens
+
+
+def iter_chunks(
+    text, max_tokens=2000, overlap=0, estimate_tokens=estimate_tokens
+):
+    """
+    Yields chunks of whole sentences of at most max_tokens each.
+    A chunk is closed early at a paragraph break once it is three quarters
+    full, and up to overlap tokens of trailing sentences are repeated at the
+    start of the next chunk.
+    """
+    overlap = min(overlap, max_tokens // 2)
+    chunk, chunk_tokens, fresh = [], 0, False
+    for sentence in iter_sentences(text, max_tokens, estimate_tokens):
+        _, tokens, ends_paragraph = sentence
+        if chunk_tokens + tokens > max_tokens:
+            if fresh:
+                yield join_sentences(chunk)
+                chunk, chunk_tokens = overlap_tail(chunk, min(overlap, max_tokens - tokens))
+            else:
+                # Only the overlap is left; keep as much of it as still fits
+                chunk, chunk_tokens = overlap_tail(chunk, max_tokens - tokens)
+        chunk.append(sentence)
+        chunk_tokens += tokens
+        fresh = True
+        if ends_paragraph and chunk_tokens >= max_tokens * 3 // 4:
+            yield join_sentences(chunk)
+            chunk, chunk_tokens = overlap_tail(chunk, overlap)
+            fresh = False
+    if fresh:
+        yield join_sentences(chunk)
+
+
+def chunk_text(text, max_tokens=2000, overlap=0):
+    """
+    Splits the text into chunks of whole sentences.
+    max_tokens is the estimated token budget per chunk.
+    """
+    return list(iter_chunks(text, max_tokens, overlap))
+
+
+def document_index(text):
+    """
+    BM25 index over CHUNK_TOKENS passages of text, built on first use and
+    then loaded from disk.
+    """
+    # NumPy is only loaded once a document is first searched
+    from retrieval import get_index
+
+    return get_index(
+        content_key(text),
+        (CHUNK_TOKENS, CHUNK_OVERLAP),
+        lambda: chunk_text(text, CHUNK_TOKENS, CHUNK_OVERLAP),
+    )
+
+
+# -------------------- HELPER: PLANNING --------------------
+def plan_processing(
+    token_count,
+    model_name=model_name,
+    max_call_tokens=MAX_CALL_TOKENS,
+    fan_in=REDUCE_FAN_IN,
+    max_workers=MAX_CONCURRENCY,
+    chunks=None,
+):
+    """
+    Picks the fewest round trips that keep every call inside the model's
+    context window: the whole document in one call ("single"), one call per
+    chunk and one merge ("chunked"), or chunks merged over several levels
+    ("hierarchical"). Returns the strategy, the chunk size to use and the
+    predicted calls, tokens, cost and latency. Chunks closed early at
+    paragraph breaks make more chunks than the token count suggests, so
+    pass chunks once the text has been split to predict from the real count.
+    """
+    profile = MODEL_PROFILES.get(model_name, DEFAULT_MODEL_PROFILE)
+    overhead = estimate_tokens(SUMMARY_SYSTEM_MESSAGE) + estimate_tokens(PACKED_SYSTEM_MESSAGE)
+    budget = int(profile["input_tokens"] * CONTEXT_SHARE) - overhead
+    if max_call_tokens:
+        budget = min(budget, max_call_tokens)
+    even_chunks = max(1, -(-token_count // budget))
+    # Even chunks, with some room for cutting at sentence boundaries
+    chunk_tokens = max(1, min(budget, -(-token_count * 11 // (even_chunks * 10))))
+    chunks = chunks or even_chunks
+
+    fan_in = max(fan_in, 2)
+    levels = reduce_calls = reduce_input = 0
+    width = chunks
+    while width > 1:
+        reduce_input += width * SUMMARY_REPLY_TOKENS + overhead
+        width = -(-width // fan_in)
+        reduce_calls += width
+        levels += 1
+
+    def call_seconds(input_tokens, output_tokens):
+        return (
+            profile["round_trip_seconds"]
+            + input_tokens / profile["input_tokens_per_second"]
+            + output_tokens / profile["output_tokens_per_second"]
+        )
+
+    waves = -(-chunks // max(max_workers, 1))
+    input_tokens = token_count + chunks * overhead + reduce_input
+    output_tokens = (chunks + reduce_calls) * SUMMARY_REPLY_TOKENS
+    return {
+        "strategy": "single" if chunks == 1 else "chunked" if levels == 1 else "hierarchical",
+        "tokens": token_count,
+        "chunks": chunks,
+        "chunk_tokens": chunk_tokens,
+        "calls": chunks + reduce_calls,
+        "round_trips": waves + levels,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost_usd": (
+            input_tokens * profile["input_price"] + output_tokens * profile["output_price"]
+        )
+        / 1_000_000,
+        "seconds": waves * call_seconds(chunk_tokens + overhead, SUMMARY_REPLY_TOKENS)
+        + levels * call_seconds(fan_in * SUMMARY_REPLY_TOKENS + overhead, SUMMARY_REPLY_TOKENS),
+    }
+
+
+def split_for_plan(text, plan):
+    """
+    The chunks a plan calls for; a document that fits in one call is sent whole.
+    """
+    if plan["chunks"] == 1:
+        return [text]
+    return chunk_text(text, plan["chunk_tokens"], CHUNK_OVERLAP)
+
+
+def dedupe_chunks(chunks):
+    """
+    Returns the indexes of the chunks worth sending to the model and, for
+    every chunk, the index of the chunk whose result it reuses.
+    """
+    with span("dedup", chunks=len(chunks)) as record:
+        assignments = find_duplicates(chunks)
+        unique = sorted(set(assignments))
+        record["calls_saved"] = len(chunks) - len(unique)
+    return unique, assignments
+
+
+# -------------------- HELPER: MODEL CALLS --------------------
+def get_model():
+    return get_client(model_name)
+
+
+llm_cache = None
+llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    global llm_cache
+    with llm_cache_lock:
+        if llm_cache is None and LLM_CACHE_PATH:
+            llm_cache = DiskCache(
+                LLM_CACHE_PATH,
+                max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024,
+                max_age=LLM_CACHE_MAX_AGE_DAYS * 24 * 3600,
+            )
+    return llm_cache
+
+
+def llm_cache_metrics():
+    cache = get_llm_cache()
+    if cache is None:
+        return {}
+    return {f"llm_cache_{name}": value for name, value in cache.stats().items()}
+
+
+register_collector(llm_cache_metrics)
+
+
+def response_key(model, system_message, content):
+    name = getattr(model, "model_name", model_name)
+    return content_key(name, system_message, content)
+
+
+def cached_response(key):
+    cache = get_llm_cache()
+    cached = cache.get(key) if cache is not None else None
+    return json.loads(cached) if cached is not None else None
+
+
+def store_response(key, result):
+    cache = get_llm_cache()
+    if cache is not None:
+        cache.set(key, json.dumps(result))
+
+
+JSON_STRING_PREFIX = re.compile(r'(?:[^"\\]|\\u[0-9a-fA-F]{4}|\\[^u])*')
+
+
+def partial_json_string(text, field):
+    """
+    The value of a string field of a JSON object that may be cut off part
+    way through, decoded as far as it has arrived. None if it hasn't started.
+    """
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(field), text)
+    if not match:
+        return None
+    raw = JSON_STRING_PREFIX.match(text, match.end()).group()
+    value = json.loads(f'"{raw}"')
+    # Hold back half of a surrogate pair until the other half arrives
+    return value[:-1] if value and "\ud800" <= value[-1] <= "\udbff" else value
+
+
+def stream_reply(model, prompt, on_partial, record):
+    """
+    Streams the reply, calling on_partial({"title": ..., "summary": ...})
+    with the fields decoded so far each time the summary grows. Clients
+    that can't stream get one buffered request instead.
+    Returns (reply_text, usage_metadata).
+    """
+    config = {"response_mime_type": "application/json"}
+    started = time.perf_counter()
+    try:
+        response = model.generate_content(prompt, generation_config=config, stream=True)
+    except TypeError:
+        response = model.generate_content(prompt, generation_config=config)
+        return response.text, getattr(response, "usage_metadata", None)
+
+    text = ""
+    shown = ""
+    for piece in response:
+        if not text:
+            record["first_token_seconds"] = time.perf_counter() - started
+        text += piece.text
+        summary = partial_json_string(text, "summary")
+        if summary and summary != shown:
+            shown = summary
+            on_partial({"title": partial_json_string(text, "title") or "", "summary": summary})
+    return text, getattr(response, "usage_metadata", None)
+
+
+def request_json(model, prompt, on_partial=None):
+    with span("model_call", prompt_chars=len(prompt)) as record:
+        if on_partial and STREAM_RESPONSES:
+            # Retries restart the stream, so partial text may start over
+            text, usage = get_scheduler().call(
+                lambda: stream_reply(model, prompt, on_partial, record)
+            )
+        else:
+            response = get_scheduler().call(
+                lambda: model.generate_content(
+                    prompt,
+                    generation_config={"response_mime_type": "application/json"},
+                )
+            )
+            text, usage = response.text, getattr(response, "usage_metadata", None)
+        record["response_chars"] = len(text)
+        record["prompt_tokens"] = getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt)
+        record["response_tokens"] = getattr(
+            usage, "candidates_token_count", None
+        ) or estimate_tokens(text)
+        formatted_response = text.replace("```json", "").replace("```", "")
+        return json.loads(formatted_response)
+
+
+def call_model(model, system_message, content, on_partial=None):
+    """
+    Sends system_message and content to the model through the shared
+    scheduler and parses the JSON reply.
+    Replies are cached on disk by model name, system message and content, so
+    unchanged chunks are never billed twice. With on_partial, the reply is
+    streamed and on_partial sees the summary as it is written.
+    """
+    key = response_key(model, system_message, content)
+    result = cached_response(key)
+    if result is None:
+        result = request_json(model, f"{system_message}\n\n{content}", on_partial)
+        store_response(key, result)
+    return result
+
+
+def pack_contents(contents, indexes, pack_tokens, max_pack):
+    packs = []
+    pack, pack_size = [], 0
+    for index in indexes:
+        tokens = estimate_tokens(contents[index])
+        if pack and (pack_size + tokens > pack_tokens or len(pack) >= max_pack):
+            packs.append(pack)
+            pack, pack_size = [], 0
+        pack.append(index)
+        pack_size += tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def call_model_packed(
+    model,
+    system_message,
+    contents,
+    pack_tokens=PACK_TOKENS,
+    max_workers=MAX_CONCURRENCY,
+    on_result=None,
+    on_partial=None,
+    reply_tokens=SUMMARY_REPLY_TOKENS,
+):
+    """
+    Answers system_message for every content, returning results in order.
+    Uncached contents are packed into requests of up to pack_tokens, and no
+    more contents than leave reply_tokens each within the model's output
+    limit. The reply is split back out per content, so each result is cached
+    exactly as if it had been sent on its own. A pack whose reply does not
+    parse or line up is retried one content at a time.
+    Contents sent on their own are streamed to on_partial(index, partial).
+    """
+    results = [None] * len(contents)
+    keys = [response_key(model, system_message, c) for c in contents]
+    pending = []
+    for index, key in enumerate(keys):
+        results[index] = cached_response(key)
+        if results[index] is None:
+            pending.append(index)
+        elif on_result:
+            on_result(index, results[index])
+
+    if pack_tokens:
+        name = getattr(model, "model_name", model_name)
+        profile = MODEL_PROFILES.get(name, DEFAULT_MODEL_PROFILE)
+        max_pack = max(1, profile["output_tokens"] // max(reply_tokens, 1))
+        packs = pack_contents(contents, pending, pack_tokens, max_pack)
+    else:
+        packs = [[index] for index in pending]
+
+    def run_pack(pack):
+        if len(pack) > 1:
+            prompt = PACKED_SYSTEM_MESSAGE.format(
+                system_message=system_message.strip(), count=len(pack)
+            )
+            sections = "\n\n".join(
+                f"### Section {n + 1}\n{contents[index]}" for n, index in enumerate(pack)
+            )
+            try:
+                reply = request_json(model, f"{prompt}\n\n{sections}")
+            except ValueError:
+                # A truncated or malformed reply; the contents are sent one by one
+                reply = None
+            answers = reply.get("results", []) if isinstance(reply, dict) else []
+            if len(answers) == len(pack) and all(isinstance(a, dict) for a in answers):
+                for index, answer in zip(pack, answers):
+                    store_response(keys[index], answer)
+                return answers
+        # Each content has already missed the cache above, so it is requested
+        # directly rather than through call_model, which would look it up again
+        answers = []
+        for index in pack:
+            answer = request_json(
+                model,
+                f"{system_message}\n\n{contents[index]}",
+                on_partial and (lambda partial, index=index: on_partial(index, partial)),
+            )
+            store_response(keys[index], answer)
+            answers.append(answer)
+        return answers
+
+    def finish(n, answers):
+        for index, answer in zip(packs[n], answers):
+            results[index] = answer
+            if on_result:
+                on_result(index, answer)
+
+    map_chunks(run_pack, packs, max_workers, finish)
+    return results
+
+
+def map_chunks(fn, chunks, max_workers=MAX_CONCURRENCY, on_result=None):
+    """
+    Runs fn over every chunk with at most max_workers calls in flight.
+    Results are returned in chunk order, whatever order the calls finish in;
+    on_result(index, result) is called as each one finishes.
+    """
+    results = [None] * len(chunks)
+
+    def finish(index, result):
+        results[index] = result
+        if on_result:
+            on_result(index, result)
+
+    if max_workers <= 1 or len(chunks) <= 1:
+        for index, chunk in enumerate(chunks):
+            finish(index, fn(chunk))
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+        # Each call keeps the caller's context, e.g. the scheduler session
+        futures = {
+            pool.submit(contextvars.copy_context().run, fn, chunk): i
+            for i, chunk in enumerate(chunks)
+        }
+        try:
+            for future in as_completed(futures):
+                finish(futures[future], future.result())
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+    return results
+
+
+def clip_words(text, max_words):
+    """
+    Cuts text down to max_words, ending on the last full sentence if there is one.
+    """
+    words = text.split()
+    if len(words) <= max_words:
+        return text
+    clipped = " ".join(words[:max_words])
+    end = clipped.rfind(". ")
+    return clipped[: end + 1] if end > 0 else clipped
+
+
+# -------------------- HELPER: REDUCTION --------------------
+def reduce_summaries(
+    model,
+    summaries,
+    fan_in=REDUCE_FAN_IN,
+    target_words=SUMMARY_TARGET_WORDS,
+    max_workers=MAX_CONCURRENCY,
+    on_partial=None,
+):
+    """
+    Tree-reduces chunk summaries into one summary.
+    Each level merges groups of fan_in summaries in parallel, so only one
+    level is held in memory and the result is at most target_words long.
+    The last merge is streamed to on_partial(partial).
+    """
+    fan_in = max(fan_in, 2)
+    system_message = REDUCE_SYSTEM_MESSAGE.format(target_words=target_words)
+
+    def merge_group(group, on_partial=None):
+        if len(group) == 1:
+            return group[0]
+        parts = "\n\n".join(
+            f"Part {i + 1}: {s.get('title', '')}\n{s['summary']}"
+            for i, s in enumerate(group)
+        )
+        return call_model(
+            model, system_message, f"Partial summaries:\n{parts}", on_partial
+        )
+
+    level = summaries
+    while len(level) > fan_in:
+        groups = [level[i : i + fan_in] for i in range(0, len(level), fan_in)]
+        level = map_chunks(merge_group, groups, max_workers)
+    if len(level) > 1:
+        level = [merge_group(level, on_partial)]
+
+    merged = level[0]
+    return {
+        "title": merged.get("title", "Untitled"),
+        "summary": clip_words(merged["summary"], target_words * 2),
+    }
+
+
+# -------------------- HELPER: QUIZ PLANNING --------------------
+def plan_quiz(
+    chunk_count, questions, per_call=QUIZ_QUESTIONS_PER_CALL, skip=(), ranked=None
+):
+    """
+    Returns (chunk_index, question_count) pairs for just enough calls to reach
+    questions, on chunks spread evenly across the document, or on the first
+    chunks of ranked when the chunks have been ranked by relevance.
+    """
+    order = ranked if ranked is not None else range(chunk_count)
+    candidates = [i for i in order if i not in skip]
+    calls = min(len(candidates), -(-questions // per_call))
+    if calls == 0:
+        return []
+    if ranked is not None:
+        picks = candidates[:calls]
+    else:
+        picks = [candidates[(2 * i + 1) * len(candidates) // (2 * calls)] for i in range(calls)]
+    share, extra = divmod(questions, calls)
+    return [(index, share + (1 if i < extra else 0)) for i, index in enumerate(picks)]
+
+
+def is_valid_question(question):
+    return (
+        isinstance(question, dict)
+        and question.get("question")
+        and question.get("explanation") is not None
+        and len(question.get("options", [])) >= 2
+        and question.get("correct_answer") in question["options"]
+    )
+
+
+# -------------------- AI FUNCTIONS WITH CHUNKING --------------------
+def generate_summary(
+    text,
+    model=None,
+    max_workers=MAX_CONCURRENCY,
+    fan_in=REDUCE_FAN_IN,
+    target_words=SUMMARY_TARGET_WORDS,
+    progress=None,
+):
+    """
+    progress(done, total, index, chunk_summary) is called as each chunk is
+    summarized, before the reduction starts, and with partials marked
+    "streaming" while replies arrive. The merged summary streams in at
+    index total, marked "merged". The plan is reported once, as
+    progress(0, total, plan=plan), when the text has been split.
+    """
+    try:
+        model = model or get_model()
+        tokens = estimate_tokens(text)
+        plan = plan_processing(tokens, fan_in=fan_in, max_workers=max_workers)
+        with span("chunk", chars=len(text), strategy=plan["strategy"]) as record:
+            chunks = split_for_plan(text, plan)
+            record["chunks"] = len(chunks)
+        plan = plan_processing(tokens, fan_in=fan_in, max_workers=max_workers, chunks=len(chunks))
+        if progress:
+            progress(0, len(chunks), plan=plan)
+
+        # Near-duplicate chunks reuse their representative's summary
+        unique, assignments = dedupe_chunks(chunks)
+        members = {index: [] for index in unique}
+        for index, representative in enumerate(assignments):
+            members[representative].append(index)
+        finished = []
+
+        def report(position, chunk_summary):
+            for index in members[unique[position]]:
+                finished.append(index)
+                if progress:
+                    partial = chunk_summary if index == unique[position] else None
+                    progress(len(finished), len(chunks), index, partial)
+
+        def stream_chunk(position, partial):
+            progress(
+                len(finished), len(chunks), unique[position], dict(partial, streaming=True)
+            )
+
+        def stream_merge(partial):
+            progress(
+                len(chunks), len(chunks), len(chunks), dict(partial, streaming=True, merged=True)
+            )
+
+        with span("summarize_chunks", chunks=len(unique)):
+            chunk_summaries = call_model_packed(
+                model,
+                SUMMARY_SYSTEM_MESSAGE,
+                [f"Content to summarize:\n{chunks[index]}" for index in unique],
+                PACK_TOKENS,
+                max_workers,
+                report,
+                stream_chunk if progress else None,
+            )
+
+        # Merge chunk summaries into one bounded summary
+        with span("reduce", inputs=len(chunk_summaries)):
+            reduced = reduce_summaries(
+                model,
+                chunk_summaries,
+                fan_in,
+                target_words,
+                max_workers,
+                stream_merge if progress else None,
+            )
+        topic_index = TopicIndex()
+        for index, c in zip(unique, chunk_summaries):
+            for t in c.get("topics", []):
+                topic_index.add(t, members[index])
+
+        final_summary = {
+            "title": reduced["title"],
+            "topics": topic_index.topics,
+            # Sections only say where a topic is when there is more than one
+            "topic_sources": topic_index.to_dict() if len(chunks) > 1 else {},
+            "summary": reduced["summary"],
+            "plan": plan,
+        }
+        return final_summary
+
+    except Exception as e:
+        print(str(e))
+        return {"error": str(e)}
+
+
+def rank_for_topics(index, topics, assignments, k=RETRIEVAL_TOP_K):
+    """
+    The k most relevant chunks for each topic, taken in turns so every topic
+    gets its best chunk before any gets its second, with duplicates mapped
+    to the chunk that represents them.
+    """
+    with span("retrieve", queries=len(topics), k=k) as record:
+        hits = [[i for i, _ in index.search(topic, k)] for topic in topics]
+        ranked = []
+        for turn in range(k):
+            for topic_hits in hits:
+                if turn < len(topic_hits):
+                    representative = assignments[topic_hits[turn]]
+                    if representative not in ranked:
+                        ranked.append(representative)
+        record["hits"] = len(ranked)
+    return ranked
+
+
+def generate_corpus_summary(
+    documents,
+    model=None,
+    max_workers=MAX_CONCURRENCY,
+    fan_in=REDUCE_FAN_IN,
+    target_words=SUMMARY_TARGET_WORDS,
+    progress=None,
+):
+    """
+    Merges the summaries of several documents (generate_summary results)
+    into one, without reading their text again. topic_sources holds the
+    ranges of document indexes each topic came from. progress sees the
+    merged summary stream in, like generate_summary's.
+    """
+    try:
+        model = model or get_model()
+
+        def stream_merge(partial):
+            progress(0, 1, 0, dict(partial, streaming=True, merged=True))
+
+        with span("reduce", inputs=len(documents)):
+            reduced = reduce_summaries(
+                model,
+                documents,
+                fan_in,
+                target_words,
+                max_workers,
+                stream_merge if progress else None,
+            )
+        topic_index = TopicIndex()
+        for index, document in enumerate(documents):
+            for t in document.get("topics", []):
+                topic_index.add(t, [index])
+
+        return {
+            "title": reduced["title"],
+            "topics": topic_index.topics,
+            "topic_sources": topic_index.to_dict(),
+            "summary": reduced["summary"],
+        }
+
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def generate_quiz(
+    text,
+    model=None,
+    max_workers=MAX_CONCURRENCY,
+    questions=QUIZ_QUESTIONS,
+    progress=None,
+    topics=None,
+):
+    """
+    progress(done, total, batch, questions) is called with the number of
+    questions collected and each batch of new questions.
+    Questions come from CHUNK_TOKENS passages: with topics, the passages
+    most relevant to them; otherwise passages spread across the document,
+    so the cost doesn't grow with its length.
+    """
+    try:
+        model = model or get_model()
+        with span("chunk", chars=len(text)) as record:
+            if topics:
+                index = document_index(text)
+                chunks = index.chunks
+            else:
+                chunks = chunk_text(text, CHUNK_TOKENS, CHUNK_OVERLAP)
+            record["chunks"] = len(chunks)
+
+        # Repeated boilerplate is only worth quizzing on once
+        unique, assignments = dedupe_chunks(chunks)
+        ranked = None
+        if topics:
+            position = {chunk: p for p, chunk in enumerate(unique)}
+            ranked = [position[i] for i in rank_for_topics(index, topics, assignments)]
+        chunks = [chunks[index] for index in unique]
+
+        def quiz_chunk(step):
+            index, count = step
+            result = call_model(
+                model,
+                QUIZ_SYSTEM_MESSAGE.format(count=count),
+                f"Content for quiz generation:\n{chunks[index]}",
+            )
+            valid = [q for q in result.get("quiz", []) if is_valid_question(q)]
+            return [(index, q) for q in valid[:count]]
+
+        # Plan more calls only for the shortfall, on chunks not asked yet
+        all_quizzes = []
+        batches = []
+        used = set()
+
+        def collect(_, chunk_quiz):
+            all_quizzes.extend(chunk_quiz)
+            batches.append(chunk_quiz)
+            if progress:
+                progress(
+                    min(len(all_quizzes), questions),
+                    questions,
+                    len(batches),
+                    [q for _, q in chunk_quiz],
+                )
+
+        while len(all_quizzes) < questions:
+            plan = plan_quiz(
+                len(chunks), questions - len(all_quizzes), skip=used, ranked=ranked
+            )
+            if not plan:
+                break
+            used.update(index for index, _ in plan)
+            map_chunks(quiz_chunk, plan, max_workers, collect)
+
+        all_quizzes.sort(key=lambda item: item[0])
+        final_quiz = {"quiz": [q for _, q in all_quizzes[:questions]]}
+        return final_quiz
+
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def answer_question(text, question, model=None, k=RETRIEVAL_TOP_K):
+    """
+    Answers question from the k chunks most relevant to it, in one model
+    call, so cost depends on k rather than on the document length.
+    Returns {"answer": ..., "sources": [chunk indexes]}.
+    """
+    try:
+        model = model or get_model()
+        index = document_index(text)
+        with span("retrieve", queries=1, k=k) as record:
+            hits = sorted(i for i, _ in index.search(question, k))
+            record["hits"] = len(hits)
+        if not hits:
+            return {"answer": "The document doesn't seem to cover this.", "sources": []}
+
+        excerpts = "\n\n".join(
+            f"Excerpt {number}:\n{index.chunks[i]}" for number, i in enumerate(hits, 1)
+        )
+        result = call_model(
+            model,
+            ANSWER_SYSTEM_MESSAGE,
+            f"Question: {question}\n\nDocument excerpts:\n{excerpts}",
+        )
+        used = [
+            hits[n - 1]
+            for n in result.get("excerpts", [])
+            if isinstance(n, int) and 0 < n <= len(hits)
+        ]
+        return {"answer": result.get("answer", ""), "sources": used or hits}
+
+    except Exception as e:
+        return {"error": str(e)}
@@ -0,0 +1,12 @@
+"""
+Token estimates shared by extraction and generation, without loading a model.
+"""
+
+
+def estimate_tokens(text):
+    """
+    Rough token count for Gemini models: about 4 characters per token for
+    ASCII text, and a token per character otherwise (e.g. Chinese or Japanese).
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (ascii_chars + 3) // 4 + len(text) - ascii_chars
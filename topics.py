@@ -0,0 +1,135 @@
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from dotenv import load_dotenv
+import os
+import re
+
+load_dotenv()
+
+# Words at least this similar are treated as spellings of the same word
+FUZZY_THRESHOLD = float(os.getenv("FUZZY_THRESHOLD", "0.88"))
+# Shorter words (acronyms, Roman numerals) and numbers only match exactly
+MIN_FUZZY_WORD = 4
+# Fuzzy matching only looks at the known topics sharing the most tokens, and
+# ignores tokens so common they appear in more than MAX_POSTINGS topics
+MAX_FUZZY_CANDIDATES = 10
+MAX_POSTINGS = 50
+
+STOP_WORDS = {"a", "an", "the", "of", "and", "in", "on", "for", "to"}
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def topic_tokens(topic):
+    tokens = []
+    for token in TOKEN_PATTERN.findall(topic.casefold()):
+        if token in STOP_WORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def near_word(a, b):
+    return (
+        len(a) >= MIN_FUZZY_WORD
+        and len(b) >= MIN_FUZZY_WORD
+        and not any(c.isdigit() for c in a + b)
+        and SequenceMatcher(None, a, b).ratio() >= FUZZY_THRESHOLD
+    )
+
+
+def near_match(tokens, other):
+    """
+    True when two topics' tokens differ only in words that pair up one to
+    one as near-identical spellings, so "TCP" never matches "UDP" nor
+    "Type 1" "Type 2".
+    """
+    extra = sorted(set(tokens) - set(other))
+    missing = sorted(set(other) - set(tokens))
+    if len(extra) != len(missing):
+        return False
+    for word in extra:
+        match = next((m for m in missing if near_word(word, m)), None)
+        if match is None:
+            return False
+        missing.remove(match)
+    return True
+
+
+def chunk_ranges(indexes):
+    """
+    Compresses chunk indexes into sorted, inclusive [start, end] ranges.
+    """
+    ranges = []
+    for index in sorted(set(indexes)):
+        if ranges and index == ranges[-1][1] + 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ranges
+
+
+class TopicIndex:
+    """
+    Merges topics reported by chunk summaries and remembers which chunks
+    each topic came from.
+
+    Topics are matched first by a hash of their normalized tokens (so case,
+    word order, plurals and stop words don't matter), then word by word
+    against a bounded number of known topics that share a token with them,
+    which keeps merging linear in the number of topics.
+    """
+
+    def __init__(self):
+        self.topics = []
+        self.chunks = []
+        self.by_key = {}
+        self.by_token = defaultdict(set)
+        self.tokens = []
+
+    def find(self, topic):
+        tokens = topic_tokens(topic)
+        if not tokens:
+            return None
+        key = " ".join(sorted(set(tokens)))
+        if key in self.by_key:
+            return self.by_key[key]
+        shared = Counter()
+        for token in set(tokens):
+            postings = self.by_token.get(token, ())
+            if len(postings) <= MAX_POSTINGS:
+                shared.update(postings)
+        for position, _ in shared.most_common(MAX_FUZZY_CANDIDATES):
+            if near_match(tokens, self.tokens[position]):
+                self.by_key[key] = position
+                return position
+        return None
+
+    def add(self, topic, chunk_indexes):
+        topic = topic.strip()
+        tokens = topic_tokens(topic)
+        if not tokens:
+            return
+        position = self.find(topic)
+        if position is None:
+            position = len(self.topics)
+            self.topics.append(topic)
+            self.chunks.append(set())
+            self.tokens.append(tokens)
+            self.by_key[" ".join(sorted(set(tokens)))] = position
+            for token in tokens:
+                self.by_token[token].add(position)
+        self.chunks[position].update(chunk_indexes)
+
+    def sources(self, topic):
+        """
+        Chunk ranges a topic (or a variant spelling of it) came from.
+        """
+        position = self.find(topic)
+        return chunk_ranges(self.chunks[position]) if position is not None else []
+
+    def to_dict(self):
+        return {
+            topic: chunk_ranges(chunks) for topic, chunks in zip(self.topics, self.chunks)
+        }